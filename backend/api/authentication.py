@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from users.models import User
+
+from .metrics import metrics
+
+DEFAULTS = {
+    "LOCAL_SIZE": 1024,
+    "LOCAL_TIMEOUT": 10,
+    "TIMEOUT": 60,
+}
+SNAPSHOT_FIELDS = tuple(
+    field.attname
+    for field in User._meta.concrete_fields
+    if field.attname
+    in (
+        "id",
+        "email",
+        "username",
+        "first_name",
+        "last_name",
+        "is_active",
+        "is_staff",
+        "is_superuser",
+    )
+)
+
+
+class TokenCache:
+    """
+    Кэш токен -> поля пользователя в два уровня: LRU в памяти процесса
+    с коротким временем жизни и общий кэш Django. Удаление токена и
+    сохранение пользователя сбрасывают оба уровня, но в памяти других
+    процессов запись живет до LOCAL_TIMEOUT секунд. Общим кэш Django
+    становится только с внешним бэкендом (CACHE_BACKEND, CACHE_LOCATION),
+    с LocMemCache по умолчанию второй уровень у каждого процесса свой и
+    отозванный токен действует в других процессах до TIMEOUT секунд.
+    QuerySet.update() сигналов не отправляет, поэтому после массового
+    изменения пользователей нужно вызвать invalidate_users, как это
+    делает действие блокировки в админке.
+    Настройки берутся из REST_FRAMEWORK["TOKEN_CACHE"]
+    """
+
+    key = "auth_token:v1:{digest}"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+
+    @property
+    def options(self):
+        return {
+            **DEFAULTS,
+            **settings.REST_FRAMEWORK.get("TOKEN_CACHE", {}),
+        }
+
+    def get_key(self, token):
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        return self.key.format(digest=digest)
+
+    def get(self, token):
+        key = self.get_key(token)
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.local.move_to_end(key)
+                metrics.count("token_cache_local_hit")
+                return entry[1]
+        snapshot = cache.get(key)
+        if snapshot is None:
+            metrics.count("token_cache_miss")
+            return None
+        metrics.count("token_cache_shared_hit")
+        self._remember(key, snapshot)
+        return snapshot
+
+    def set(self, token, user):
+        snapshot = tuple(getattr(user, field) for field in SNAPSHOT_FIELDS)
+        key = self.get_key(token)
+        cache.set(key, snapshot, timeout=self.options["TIMEOUT"])
+        self._remember(key, snapshot)
+        return snapshot
+
+    def invalidate(self, *tokens):
+        keys = [self.get_key(token) for token in tokens]
+        with self.lock:
+            for key in keys:
+                self.local.pop(key, None)
+        cache.delete_many(keys)
+
+    def invalidate_users(self, user_ids):
+        self.invalidate(
+            *Token.objects.filter(user_id__in=user_ids).values_list(
+                "key", flat=True
+            )
+        )
+
+    def _remember(self, key, snapshot):
+        options = self.options
+        if options["LOCAL_SIZE"] <= 0:
+            return
+        with self.lock:
+            self.local[key] = (
+                time.monotonic() + options["LOCAL_TIMEOUT"],
+                snapshot,
+            )
+            self.local.move_to_end(key)
+            while len(self.local) > options["LOCAL_SIZE"]:
+                self.local.popitem(last=False)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к базе при попадании в кэш.
+    Пользователь собирается из сохраненных полей, остальные поля
+    загружаются из базы при первом обращении
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            try:
+                token = Token.objects.select_related("user").get(key=key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed(_("Invalid token."))
+            snapshot = token_cache.set(key, token.user)
+        user = User.from_db(User.objects.db, SNAPSHOT_FIELDS, snapshot)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        return user, Token(key=key, user=user)
+
+
+token_cache = TokenCache()
@@ -1,25 +1,40 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramSimilarity,
+)
+from django import forms
+from django.db import connections
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.indexes import tag_index
+from recipes.models import Favorite, Recipe, ShoppingCart
 
+SEARCH_CONFIG = "russian"
 
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr="istartswith")
 
-    class Meta:
-        model = Ingredient
-        fields = ("name",)
+class MultipleValueField(forms.Field):
+    """Все значения повторяющегося параметра запроса"""
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [item for item in value or [] if item]
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = MultipleValueField
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        to_field_name="slug",
-        queryset=Tag.objects.all(),
-    )
+    tags = MultipleValueFilter(method="tags_filter")
     is_favorited = filters.BooleanFilter(method="is_favorited_filter")
     is_in_shopping_cart = filters.BooleanFilter(
         method="is_in_shopping_cart_filter"
     )
+    search = filters.CharFilter(method="search_filter")
 
     class Meta:
         model = Recipe
@@ -28,14 +43,65 @@ class RecipeFilter(FilterSet):
             "author",
         )
 
+    def tags_filter(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, без соединения с таблицей
+        тегов и без дубликатов"""
+        if not value:
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"), tag__in=tag_index.get_ids(value)
+                )
+            )
+        )
+
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(in_favorite__user=user)
+            return queryset.filter(
+                Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+                )
+            )
         return queryset
 
     def is_in_shopping_cart_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(in_shopping_cart__user=user)
+            return queryset.filter(
+                Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef("pk")
+                    )
+                )
+            )
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию и описанию с ранжированием.
+        Опечатки в названии находятся по триграммам. Вне PostgreSQL
+        выполняется простой поиск по вхождению подстроки
+        """
+        if connections[queryset.db].vendor != "postgresql":
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        vector = RawSQL(
+            f'"{Recipe._meta.db_table}"."search_vector"',
+            [],
+            output_field=SearchVectorField(),
+        )
+        return (
+            queryset.alias(search_vector=vector)
+            .filter(Q(search_vector=query) | Q(name__trigram_similar=value))
+            .annotate(
+                rank=SearchRank(vector, query),
+                similarity=TrigramSimilarity("name", value),
+            )
+            .order_by("-rank", "-similarity", "-id")
+        )
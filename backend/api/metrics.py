@@ -0,0 +1,208 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = "foodgram"
+
+COUNTERS = (
+    ("requests", "http_requests_total", "Количество запросов"),
+    ("queries", "db_queries_total", "Количество SQL-запросов"),
+    (
+        "sql_seconds",
+        "db_query_duration_seconds_total",
+        "Суммарное время SQL-запросов",
+    ),
+    (
+        "response_bytes",
+        "http_response_bytes_total",
+        "Суммарный размер ответов",
+    ),
+)
+
+
+def new_sample():
+    return {
+        "requests": 0,
+        "queries": 0,
+        "sql_seconds": 0.0,
+        "response_bytes": 0,
+        "duration_sum": 0.0,
+        "buckets": [0] * (len(BUCKETS) + 1),
+    }
+
+
+def merge(target, source):
+    for key, sample in source.items():
+        total = target.setdefault(key, new_sample())
+        for name, value in sample.items():
+            if name == "buckets":
+                total[name] = [a + b for a, b in zip(total[name], value)]
+            else:
+                total[name] += value
+
+
+class Metrics:
+    """
+    Счетчики запросов по имени представления и методу. Данные копятся в
+    памяти процесса. Если задан METRICS_MULTIPROCESS_DIR, каждый процесс
+    не чаще раза в METRICS_FLUSH_INTERVAL секунд и при завершении
+    сохраняет свои счетчики в отдельный файл каталога, при выводе файлы
+    всех процессов суммируются. Каталог нужно очищать перед запуском
+    сервера
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        atexit.register(self.flush)
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.samples = {}
+        self.events = {}
+        self.flushed = 0.0
+
+    @property
+    def directory(self):
+        return settings.METRICS_MULTIPROCESS_DIR
+
+    def observe(self, view, method, duration, queries, sql_seconds, size):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            sample = self.samples.get((view, method))
+            if sample is None:
+                sample = self.samples[view, method] = new_sample()
+            sample["requests"] += 1
+            sample["queries"] += queries
+            sample["sql_seconds"] += sql_seconds
+            sample["response_bytes"] += size
+            sample["duration_sum"] += duration
+            sample["buckets"][bisect_left(BUCKETS, duration)] += 1
+            if (
+                self.directory
+                and time.monotonic() - self.flushed
+                >= settings.METRICS_FLUSH_INTERVAL
+            ):
+                self._flush()
+
+    def count(self, event):
+        """Счетчик событий вне запросов, например попаданий в кэш"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            self.events[event] = self.events.get(event, 0) + 1
+
+    def flush(self):
+        with self.lock:
+            if self.directory and self.pid == os.getpid():
+                self._flush()
+
+    def _flush(self):
+        path = os.path.join(self.directory, f"{self.pid}.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(
+                {
+                    "samples": [
+                        [*key, sample] for key, sample in self.samples.items()
+                    ],
+                    "events": self.events,
+                },
+                file,
+            )
+        os.replace(f"{path}.tmp", path)
+        self.flushed = time.monotonic()
+
+    def collect(self):
+        """Счетчики всех процессов: {(view, method): значения}
+        и {событие: количество}"""
+        samples = {}
+        events = Counter()
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            if not self.directory:
+                merge(samples, self.samples)
+                events.update(self.events)
+                return samples, events
+            self._flush()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    data = json.load(file)
+            except (OSError, ValueError):
+                continue
+            merge(
+                samples,
+                {(view, method): s for view, method, s in data["samples"]},
+            )
+            events.update(data["events"])
+        return samples, events
+
+
+def escape(value):
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def render(samples, events, counters=()):
+    """Текстовый формат Prometheus, counters - дополнительные счетчики
+    без меток в виде троек (имя, описание, значение)"""
+    lines = []
+    keys = sorted(samples)
+    labels = {
+        key: f'view="{escape(key[0])}",method="{escape(key[1])}"'
+        for key in keys
+    }
+    for field, name, description in COUNTERS:
+        lines += [
+            f"# HELP {PREFIX}_{name} {description}",
+            f"# TYPE {PREFIX}_{name} counter",
+        ]
+        lines += [
+            f"{PREFIX}_{name}{{{labels[key]}}} {samples[key][field]}"
+            for key in keys
+        ]
+    name = f"{PREFIX}_http_request_duration_seconds"
+    lines += [
+        f"# HELP {name} Время обработки запроса",
+        f"# TYPE {name} histogram",
+    ]
+    for key in keys:
+        sample = samples[key]
+        total = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), sample["buckets"]):
+            total += count
+            lines.append(
+                f'{name}_bucket{{{labels[key]},le="{bound}"}} {total}'
+            )
+        lines += [
+            f"{name}_sum{{{labels[key]}}} {sample['duration_sum']}",
+            f"{name}_count{{{labels[key]}}} {sample['requests']}",
+        ]
+    name = f"{PREFIX}_events_total"
+    lines += [f"# HELP {name} Количество событий", f"# TYPE {name} counter"]
+    lines += [
+        f'{name}{{event="{escape(event)}"}} {events[event]}'
+        for event in sorted(events)
+    ]
+    for name, description, value in counters:
+        lines += [
+            f"# HELP {PREFIX}_{name} {description}",
+            f"# TYPE {PREFIX}_{name} counter",
+            f"{PREFIX}_{name} {value}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,53 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import metrics
+
+UNRESOLVED = "<unresolved>"
+
+
+class QueryTimer:
+    """Обертка execute_wrapper, считает SQL-запросы и их время"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Время обработки, число и время SQL-запросов и размер ответа
+    для каждого представления и метода
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        metrics.observe(
+            match.view_name if match else UNRESOLVED,
+            request.method,
+            duration,
+            timer.count,
+            timer.seconds,
+            0 if response.streaming else len(response.content),
+        )
+        return response
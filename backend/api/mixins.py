@@ -0,0 +1,39 @@
+from api.serializers import BulkIdsSerializer
+from django.utils.functional import SimpleLazyObject
+from rest_framework.response import Response
+from users.models import Follow
+
+
+class SubscriptionsContextMixin:
+    """
+    Множество id авторов, на которых подписан пользователь, вычисляется
+    один раз за запрос и передается сериализаторам через контекст
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user = self.request.user
+        if user.is_authenticated:
+            context["subscriptions"] = SimpleLazyObject(
+                lambda: set(
+                    Follow.objects.filter(user=user).values_list(
+                        "author_id", flat=True
+                    )
+                )
+            )
+        return context
+
+
+class BulkIdsMixin:
+    """Массовые действия: список id в теле запроса и результат по каждому
+    id в ответе"""
+
+    def get_bulk_ids(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data["ids"]))
+
+    def get_bulk_response(self, ids, statuses):
+        return Response(
+            {"results": [{"id": pk, "status": statuses[pk]} for pk in ids]}
+        )
@@ -1,6 +1,228 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+
+COUNT_GENERATION_KEY = "pagination_count_generation"
+
+
+def invalidate_counts(user_id=None):
+    """Сбрасывает закэшированные количества объектов: все при создании
+    и удалении рецептов и пользователей либо только зависящие от
+    пользователя user_id при изменении его избранного, списка покупок
+    и подписок"""
+    key = COUNT_GENERATION_KEY
+    if user_id is not None:
+        key = f"{COUNT_GENERATION_KEY}:{user_id}"
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Паджинатор Django, который кэширует количество объектов.
+    Для больших таблиц без фильтров в PostgreSQL берется оценка
+    из статистики планировщика
+    """
+
+    def __init__(self, object_list, per_page, cache_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+
+    @cached_property
+    def count(self):
+        if self.cache_key is None:
+            return super().count
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = self.get_estimated_count()
+            if count is None:
+                count = super().count
+            cache.set(
+                self.cache_key,
+                count,
+                settings.PAGINATION_COUNT_CACHE_TIMEOUT,
+            )
+        return count
+
+    def get_estimated_count(self):
+        threshold = settings.PAGINATION_ESTIMATED_COUNT_THRESHOLD
+        queryset = self.object_list
+        if (
+            threshold is None
+            or not isinstance(queryset, QuerySet)
+            or queryset.query.has_filters()
+        ):
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < threshold:
+            return None
+        return row[0]
+
+
+class IdCursorPaginator(CursorPagination):
+    """Пагинация по курсору на основе id, без подсчета количества"""
+
+    page_size = 6
+    page_size_query_param = "limit"
+    ordering = "-id"
+
+
+class IdListCursorPaginator(IdCursorPaginator):
+    """
+    Пагинация по курсору для списков id, собранных из нескольких
+    источников. Функция fetch(before, after, limit) возвращает по
+    убыванию не более limit id меньше before либо ближайших id больше
+    after. Обратный курсор указывает на предыдущую страницу
+    """
+
+    def paginate_ids(self, fetch, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        position = None
+        if cursor is not None and cursor.position is not None:
+            if not cursor.position.isdigit():
+                raise NotFound(self.invalid_cursor_message)
+            position = int(cursor.position)
+        limit = self.page_size + 1
+        if cursor is not None and cursor.reverse and position is not None:
+            ids = fetch(None, position, limit)
+            self.has_previous = len(ids) > self.page_size
+            self.ids = ids[-self.page_size:]
+            self.has_next = True
+            self.position = position + 1
+        else:
+            ids = fetch(position, None, limit)
+            self.has_next = len(ids) > self.page_size
+            self.ids = ids[: self.page_size]
+            self.has_previous = position is not None
+            self.position = position and position - 1
+        return self.ids
+
+    def get_link(self, reverse, position):
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=str(position))
+        )
+
+    def get_paginated_response(self, data):
+        """Пустая страница ссылается на позицию курсора, по которому
+        она запрошена"""
+        next_link = previous_link = None
+        if self.has_next:
+            next_link = self.get_link(
+                False, self.ids[-1] if self.ids else self.position
+            )
+        if self.has_previous:
+            previous_link = self.get_link(
+                True, self.ids[0] if self.ids else self.position
+            )
+        return Response(
+            OrderedDict(
+                [
+                    ("next", next_link),
+                    ("previous", previous_link),
+                    ("results", data),
+                ]
+            )
+        )
 
 
 class PageLimitPaginator(PageNumberPagination):
+    """
+    Постраничная пагинация с кэшированием количества объектов.
+    При наличии параметра cursor, в том числе пустого, включается
+    пагинация по курсору
+    """
+
     page_size = 6
     page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    cursor_paginator_class = IdCursorPaginator
+    cursor_paginator = None
+    count_cache_key = None
+    per_user = False
+    user_query_params = ("is_favorited", "is_in_shopping_cart")
+
+    def django_paginator_class(self, object_list, per_page, **kwargs):
+        return CachedCountPaginator(
+            object_list, per_page, cache_key=self.count_cache_key, **kwargs
+        )
+
+    def get_count_cache_key(self, request):
+        excluded = {
+            self.page_query_param,
+            self.page_size_query_param,
+            self.cursor_query_param,
+            "format",
+        }
+        params = sorted(
+            (key, value)
+            for key in request.query_params
+            if key not in excluded
+            for value in request.query_params.getlist(key)
+        )
+        keys = [COUNT_GENERATION_KEY]
+        user = ""
+        per_user = self.per_user or any(
+            key in request.query_params for key in self.user_query_params
+        )
+        if per_user and request.user.is_authenticated:
+            user = request.user.id
+            keys.append(f"{COUNT_GENERATION_KEY}:{user}")
+        digest = hashlib.md5(
+            f"{request.path}|{user}|{urlencode(params)}".encode()
+        ).hexdigest()
+        generations = cache.get_many(keys)
+        generation = ".".join(str(generations.get(key, 0)) for key in keys)
+        return f"pagination_count:{generation}:{digest}"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.cursor_paginator = None
+        self.count_cache_key = self.get_count_cache_key(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class UserPageLimitPaginator(PageLimitPaginator):
+    """Постраничная пагинация для выборок, зависящих от пользователя"""
+
+    per_user = True
+
+
+class PageOnlyPaginator(PageLimitPaginator):
+    """Постраничная пагинация для выборок, не упорядоченных по id"""
+
+    cursor_query_param = None
@@ -5,7 +5,9 @@ class AuthorOrReadOnly(BasePermission):
     """Полный доступ автору, для остальных только чтение"""
 
     def has_object_permission(self, request, view, obj):
-        return request.method in SAFE_METHODS or obj.author == request.user
+        return request.method in SAFE_METHODS or (
+            request.user.is_authenticated and obj.author_id == request.user.id
+        )
 
 
 class AdminOrReadOnly(BasePermission):
@@ -1,7 +1,17 @@
 from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.cache import recipe_cache
+from recipes.indexes import pantry_index
+from recipes.models import (
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+)
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from users.models import Follow, User
@@ -40,9 +50,15 @@ class CustomUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         user = self.context.get("request").user
-        return (
-            user.is_authenticated and obj.following.filter(user=user).exists()
-        )
+        if not user.is_authenticated:
+            return False
+        is_subscribed = getattr(obj, "is_subscribed", None)
+        if is_subscribed is not None:
+            return is_subscribed
+        subscriptions = self.context.get("subscriptions")
+        if subscriptions is not None:
+            return obj.id in subscriptions
+        return obj.following.filter(user=user).exists()
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -100,15 +116,20 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "image",
             "text",
             "cooking_time",
+            "favorites_count",
+            "in_carts_count",
         )
 
-    def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        return (
-            user.is_authenticated and obj.following.filter(user=user).exists()
-        )
+    def to_representation(self, instance):
+        author_is_subscribed = getattr(instance, "author_is_subscribed", None)
+        if instance.author is not None and author_is_subscribed is not None:
+            instance.author.is_subscribed = author_is_subscribed
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
+        is_favorited = getattr(obj, "is_favorited", None)
+        if is_favorited is not None:
+            return is_favorited
         user = self.context.get("request").user
         return (
             user.is_authenticated
@@ -116,6 +137,9 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        is_in_shopping_cart = getattr(obj, "is_in_shopping_cart", None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         user = self.context.get("request").user
         return (
             user.is_authenticated
@@ -144,18 +168,37 @@ class IngredientInRecipeCreateSerializer(serializers.ModelSerializer):
         return value
 
 
+def set_prefetched(instance, name, objects):
+    """Подставляет объекты в кэш связи, как это делает prefetch_related,
+    в порядке, заданном в Meta.ordering связанной модели. Представление
+    DRF сбрасывает этот кэш после сохранения, поэтому объекты хранятся
+    в сериализаторе и подставляются при построении ответа"""
+    if name == "tags":
+        objects = sorted(objects, key=lambda tag: tag.id)
+    else:
+        objects = sorted(objects, key=lambda item: item.ingredient.name)
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache = {
+        **getattr(instance, "_prefetched_objects_cache", {}),
+        name: queryset,
+    }
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор записи и обновления рецептов"""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     author = CustomUserSerializer(read_only=True)
     id = serializers.ReadOnlyField()
     ingredients = IngredientInRecipeCreateSerializer(many=True)
     image = Base64ImageField()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded = {}
+
     class Meta:
         model = Recipe
         fields = (
@@ -176,6 +219,16 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise ValidationError("Максимальное время приготовления 600 минут")
         return value
 
+    def validate_tags(self, value):
+        """Теги загружаются одним запросом, а не по одному на id"""
+        found = Tag.objects.in_bulk(value)
+        missing = [pk for pk in value if pk not in found]
+        if missing:
+            raise ValidationError(
+                "Теги не найдены: " + ", ".join(str(pk) for pk in missing)
+            )
+        return [found[pk] for pk in dict.fromkeys(value)]
+
     def validate_ingredients(self, value):
         if not value:
             raise ValidationError("Нужно добавить хотя бы один ингредиент")
@@ -184,29 +237,87 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 "У рецепта не может быть два одинаковых ингредиента"
             )
+        found = Ingredient.objects.in_bulk(ingredients)
+        missing = [pk for pk in ingredients if pk not in found]
+        if missing:
+            raise ValidationError(
+                "Ингредиенты не найдены: "
+                + ", ".join(str(pk) for pk in missing)
+            )
+        for item in value:
+            item["ingredient"] = found[item["id"]]
         return value
 
-    def add_ingredients(self, recipe, tags, ingredients):
-        IngredientInRecipe.objects.bulk_create(
+    def add_ingredients(self, recipe, ingredients):
+        created = IngredientInRecipe.objects.bulk_create(
             [
                 IngredientInRecipe(
                     recipe=recipe,
-                    ingredient=Ingredient.objects.get(pk=ingredient["id"]),
+                    ingredient=ingredient["ingredient"],
                     amount=ingredient["amount"],
                 )
                 for ingredient in ingredients
             ]
         )
+        pantry_index.recipe_changed(recipe.id)
+        return created
+
+    def update_tags(self, recipe, tags):
+        current = set(recipe.tags.values_list("id", flat=True))
+        new = {tag.id for tag in tags}
+        if current - new:
+            recipe.tags.remove(*(current - new))
+        if new - current:
+            recipe.tags.add(*(new - current))
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.order_by()
+        }
+        new = {item["ingredient"].id: item for item in ingredients}
+        removed = current.keys() - new.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, item in current.items():
+            if (
+                ingredient_id in new
+                and item.amount != new[ingredient_id]["amount"]
+            ):
+                item.amount = new[ingredient_id]["amount"]
+                changed.append(item)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+        kept = []
+        for ingredient_id, item in current.items():
+            if ingredient_id in new:
+                item.ingredient = new[ingredient_id]["ingredient"]
+                kept.append(item)
+        return kept + self.add_ingredients(
+            recipe,
+            [item for pk, item in new.items() if pk not in current],
+        )
 
     def create(self, validated_data):
         image = validated_data.pop("image")
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
-        recipe = Recipe.objects.create(
-            author=self.context["request"].user, image=image, **validated_data
-        )
-        recipe.tags.set(tags)
-        self.add_ingredients(recipe, tags, ingredients)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=self.context["request"].user,
+                image=image,
+                **validated_data,
+            )
+            recipe.tags.set(tags)
+            items = self.add_ingredients(recipe, ingredients)
+        recipe_cache.invalidate(recipe.pk)
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
+        recipe.author_is_subscribed = False
+        self.loaded = {"tags": tags, "recipe_ingredients": items}
         return recipe
 
     def update(self, instance, validated_data):
@@ -216,18 +327,47 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         instance.cooking_time = validated_data.get(
             "cooking_time", instance.cooking_time
         )
-        tags = validated_data.pop("tags")
-        ingredients = validated_data.pop("ingredients")
-        instance.tags.clear()
-        instance.tags.set(tags)
-        IngredientInRecipe.objects.filter(
-            recipe=instance, ingredient__in=instance.ingredients.all()
-        ).delete()
-        self.add_ingredients(instance, tags, ingredients)
-        instance.save()
+        tags = validated_data.pop("tags", None)
+        ingredients = validated_data.pop("ingredients", None)
+        cart_users = []
+        if ingredients is not None and instance.in_carts_count:
+            cart_users = list(
+                instance.in_shopping_cart.order_by().values_list(
+                    "user", flat=True
+                )
+            )
+        with transaction.atomic():
+            if cart_users:
+                ShoppingListItem.objects.remove_recipes(
+                    cart_users, [instance.id]
+                )
+            if tags is not None:
+                self.update_tags(instance, tags)
+                self.loaded["tags"] = tags
+            if ingredients is not None:
+                self.loaded["recipe_ingredients"] = self.update_ingredients(
+                    instance, ingredients
+                )
+            fields = [
+                name
+                for name in ("image", "name", "text", "cooking_time")
+                if name in validated_data
+            ]
+            if fields:
+                instance.save(update_fields=fields)
+            if cart_users:
+                ShoppingListItem.objects.add_recipes(cart_users, [instance.id])
+        recipe_cache.invalidate(instance.pk)
         return instance
 
     def to_representation(self, instance):
+        """Ответ строится из уже загруженных объектов, из базы читаются
+        только теги и ингредиенты, которые не передавались в запросе"""
+        for name, objects in self.loaded.items():
+            set_prefetched(instance, name, objects)
+        prefetch_related_objects(
+            [instance], *Recipe.objects.related_lookups()
+        )
         return RecipeReadSerializer(instance, context=self.context).data
 
 
@@ -251,7 +391,7 @@ class FollowSerializer(CustomUserSerializer):
     last_name = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Follow
@@ -266,22 +406,27 @@ class FollowSerializer(CustomUserSerializer):
             "recipes_count",
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-    def get_is_subscribed(self, obj):
-        user = self.context.get("request").user
-        return (
-            user.is_authenticated and obj.following.filter(user=user).exists()
-        )
-
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[: int(limit)]
+        author_recipes = self.context.get("author_recipes")
+        if author_recipes is not None:
+            recipes = author_recipes.get(obj.id, [])
+        else:
+            request = self.context.get("request")
+            limit = request.GET.get("recipes_limit")
+            recipes = obj.recipes.all()
+            if limit is not None:
+                recipes = recipes[: int(limit)]
         serializer = StrippedRecipeSerializer(
             recipes, many=True, read_only=True
         )
         return serializer.data
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массовых действий"""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS,
+    )
@@ -0,0 +1,80 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+PDF_FONT_NAME = "ShoppingListFont"
+PDF_FALLBACK_FONT_NAME = "Helvetica"
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(ingredients):
+    for name, measurement_unit, amount in ingredients:
+        yield f"{name}: {amount}{measurement_unit}\n"
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("Ингредиент", "Количество", "Единица измерения"))
+    for name, measurement_unit, amount in ingredients:
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+        return PDF_FALLBACK_FONT_NAME
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+    )
+    return PDF_FONT_NAME
+
+
+def render_pdf(ingredients):
+    """
+    Страницы заполняются по мере чтения строк из базы. Reportlab
+    собирает документ целиком при сохранении, поэтому готовый файл
+    отдается частями по PDF_CHUNK_SIZE
+    """
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    width, height = A4
+    document.setFont(font, PDF_FONT_SIZE)
+    document.drawString(PDF_MARGIN, height - PDF_MARGIN, "Список покупок")
+    position = height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+    for name, measurement_unit, amount in ingredients:
+        if position < PDF_MARGIN:
+            document.showPage()
+            document.setFont(font, PDF_FONT_SIZE)
+            position = height - PDF_MARGIN
+        document.drawString(
+            PDF_MARGIN, position, f"{name}: {amount} {measurement_unit}"
+        )
+        position -= PDF_LINE_HEIGHT
+    document.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b"")
+
+
+RENDERERS = {
+    "txt": render_txt,
+    "csv": render_csv,
+    "pdf": render_pdf,
+}
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import token_cache
+from .pagination import invalidate_counts
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def invalidate_counts_on_create(created, **kwargs):
+    if created:
+        invalidate_counts()
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def invalidate_counts_on_delete(**kwargs):
+    invalidate_counts()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache(instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_token_cache(instance, created, update_fields, **kwargs):
+    """Пароль, активность и поля профиля меняются через save(),
+    обновление только last_login при входе кэш не затрагивает"""
+    if created or update_fields == frozenset(["last_login"]):
+        return
+    token_cache.invalidate_users([instance.pk])
@@ -0,0 +1,1021 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
+
+from api.authentication import token_cache
+from api.filters import RecipeFilter
+from api.pagination import COUNT_GENERATION_KEY
+from django.apps import apps
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from recipes.cache import recipe_cache
+from recipes.indexes import ingredient_index
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    PopularityWatermark,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TimelineEntry,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIClient,
+    APITestCase,
+    APITransactionTestCase,
+)
+from users.admin import UserAdmin
+from users.models import Follow, User
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+class FoodgramTestCase(APITestCase):
+    """Пользователи, теги, ингредиенты и рецепты для тестов API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(
+                email=f"user{number}@foodgram.ru",
+                username=f"user{number}",
+                first_name="Имя",
+                last_name="Фамилия",
+            )
+            for number in range(12)
+        ]
+        cls.user = cls.users[0]
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ("Завтрак", "#E26C2D", "breakfast"),
+                ("Обед", "#49B64E", "lunch"),
+                ("Ужин", "#8775D2", "dinner"),
+            )
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(4)
+        ]
+        cls.recipes = []
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.users[number % 6 + 1],
+                name=f"Рецепт {number}",
+                text="Описание",
+                cooking_time=10,
+            )
+            recipe.tags.set(cls.tags[number % 3:number % 3 + 2])
+            IngredientInRecipe.objects.bulk_create(
+                [
+                    IngredientInRecipe(
+                        recipe=recipe, ingredient=ingredient, amount=10
+                    )
+                    for ingredient in cls.ingredients[: number % 3 + 2]
+                ]
+            )
+            cls.recipes.append(recipe)
+        for author in cls.users[1:8]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class QueryCountTest(FoodgramTestCase):
+    """Число запросов к базе не зависит от размера страницы"""
+
+    def test_user_list(self):
+        self.assertEqual(
+            self.count_queries("/api/users/?limit=2"),
+            self.count_queries("/api/users/?limit=10"),
+        )
+
+    def test_recipe_list(self):
+        self.assertEqual(
+            self.count_queries("/api/recipes/?limit=2"),
+            self.count_queries("/api/recipes/?limit=10"),
+        )
+
+
+class SubscriptionsTest(FoodgramTestCase):
+    """Подписки: число запросов не зависит от размера страницы
+    и recipes_limit ни с оконными функциями, ни без них"""
+
+    url = "/api/users/subscriptions/"
+
+    def check_query_count(self):
+        counts = set()
+        for limit, recipes_limit in ((2, 1), (6, 3), (10, 0)):
+            url = f"{self.url}?limit={limit}&recipes_limit={recipes_limit}"
+            counts.add(self.count_queries(url))
+            response = self.client.get(url)
+            self.assertEqual(len(response.data["results"]), min(limit, 7))
+            for author in response.data["results"]:
+                self.assertEqual(
+                    len(author["recipes"]),
+                    min(recipes_limit, author["recipes_count"]),
+                )
+        self.assertEqual(len(counts), 1)
+
+    def test_query_count(self):
+        self.check_query_count()
+
+    def test_query_count_without_window_functions(self):
+        with mock.patch.object(
+            connection.features, "supports_over_clause", False
+        ):
+            self.check_query_count()
+
+    def test_invalid_recipes_limit(self):
+        for value in ("abc", "-1", "1.5", ""):
+            with self.subTest(recipes_limit=value):
+                response = self.client.get(
+                    self.url, {"recipes_limit": value}
+                )
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post(
+                    f"/api/users/{self.users[9].id}/subscribe/?"
+                    f"recipes_limit={value}"
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(
+            Follow.objects.filter(user=self.user, author=self.users[9])
+        )
+
+
+class ShoppingListTest(FoodgramTestCase):
+    """Список покупок остается согласованным при удалении рецептов
+    в обход API"""
+
+    def setUp(self):
+        super().setUp()
+        for recipe in self.recipes[:3]:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        ShoppingListItem.objects.add_recipes(
+            [self.user.id], [recipe.id for recipe in self.recipes[:3]]
+        )
+
+    def get_items(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user).values_list(
+                "ingredient", "total_amount"
+            )
+        )
+
+    def test_delete_instance(self):
+        self.recipes[2].delete()
+        self.assertEqual(
+            self.get_items(),
+            {
+                self.ingredients[0].id: 20,
+                self.ingredients[1].id: 20,
+                self.ingredients[2].id: 10,
+            },
+        )
+
+    def test_delete_queryset(self):
+        Recipe.objects.filter(
+            pk__in=[recipe.id for recipe in self.recipes[:2]]
+        ).delete()
+        self.assertEqual(
+            self.get_items(),
+            {ingredient.id: 10 for ingredient in self.ingredients},
+        )
+
+
+class ShoppingListDownloadTest(FoodgramTestCase):
+    """Скачивание списка покупок во всех форматах: количества одного
+    ингредиента складываются отдельно для каждой единицы измерения"""
+
+    url = "/api/recipes/download_shopping_cart/"
+
+    def setUp(self):
+        super().setUp()
+        pieces = Ingredient.objects.create(
+            name="ингредиент 0", measurement_unit="шт"
+        )
+        for recipe, amount in zip(self.recipes[:2], (3, 4)):
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=pieces, amount=amount
+            )
+        for recipe in self.recipes[:3]:
+            response = self.client.post(
+                f"/api/recipes/{recipe.id}/shopping_cart/"
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def download(self, file_format):
+        response = self.client.get(self.url, {"format": file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment;filename="shopping_list.{file_format}"',
+        )
+        return response, b"".join(response.streaming_content)
+
+    def test_txt(self):
+        response, content = self.download("txt")
+        self.assertEqual(
+            response["Content-Type"], "text/plain; charset=utf-8"
+        )
+        self.assertEqual(
+            content.decode(),
+            "ингредиент 0: 30г\n"
+            "ингредиент 0: 7шт\n"
+            "ингредиент 1: 30г\n"
+            "ингредиент 2: 20г\n"
+            "ингредиент 3: 10г\n",
+        )
+
+    def test_csv(self):
+        response, content = self.download("csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(
+            content.decode().splitlines(),
+            [
+                "Ингредиент,Количество,Единица измерения",
+                "ингредиент 0,30,г",
+                "ингредиент 0,7,шт",
+                "ингредиент 1,30,г",
+                "ингредиент 2,20,г",
+                "ингредиент 3,10,г",
+            ],
+        )
+
+    def test_pdf(self):
+        response, content = self.download("pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(content.startswith(b"%PDF"))
+
+    def test_errors_are_json(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("detail", response.json())
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, {"format": "json"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("detail", response.json())
+
+
+class RecipeCountTest(FoodgramTestCase):
+    """Счетчик рецептов и ленты обновляются при работе через ORM"""
+
+    def test_create(self):
+        author = self.users[1]
+        recipe = Recipe.objects.create(
+            author=author, name="Новый", text="Описание", cooking_time=5
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 3)
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user, recipe=recipe
+            ).exists()
+        )
+
+    def test_delete(self):
+        self.recipes[0].delete()
+        Recipe.objects.filter(author=self.users[2]).delete()
+        self.users[1].refresh_from_db()
+        self.users[2].refresh_from_db()
+        self.assertEqual(self.users[1].recipes_count, 1)
+        self.assertEqual(self.users[2].recipes_count, 0)
+
+
+class IngredientSearchTest(FoodgramTestCase):
+    """Ингредиент попадает в выдачу поиска один раз"""
+
+    def test_prefix_and_substring(self):
+        Ingredient.objects.create(name="сосиски", measurement_unit="шт")
+        Ingredient.objects.create(name="масло", measurement_unit="г")
+        self.assertEqual(
+            [entry["name"] for entry in ingredient_index.search("с")],
+            ["сосиски", "масло"],
+        )
+
+    def test_name_param(self):
+        Ingredient.objects.create(name="сосиски", measurement_unit="шт")
+        response = self.client.get("/api/ingredients/", {"name": "СОС"})
+        self.assertEqual(
+            [entry["name"] for entry in response.data], ["сосиски"]
+        )
+
+    def test_no_queries_on_startup(self):
+        with CaptureQueriesContext(connection) as queries:
+            apps.get_app_config("recipes").ready()
+        self.assertEqual(len(queries), 0)
+
+
+class SimilarRecipesTest(FoodgramTestCase):
+    """Похожие рецепты для несуществующего рецепта"""
+
+    def test_not_found(self):
+        for pk in ("abc", "0", self.recipes[-1].id + 1):
+            with self.subTest(pk=pk):
+                response = self.client.get(f"/api/recipes/{pk}/similar/")
+                self.assertEqual(response.status_code, 404)
+
+    def test_without_similar(self):
+        response = self.client.get(
+            f"/api/recipes/{self.recipes[0].id}/similar/"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class RefreshPopularityTest(FoodgramTestCase):
+    """Свежие события откладываются до следующего запуска"""
+
+    def test_lag(self):
+        favorite = Favorite.objects.create(
+            user=self.user, recipe=self.recipes[0]
+        )
+        call_command("refresh_popularity", stdout=StringIO())
+        watermark = PopularityWatermark.objects.get(source="favorite")
+        self.assertEqual(watermark.last_id, 0)
+        call_command("refresh_popularity", "--lag", "0", stdout=StringIO())
+        watermark.refresh_from_db()
+        self.assertEqual(watermark.last_id, favorite.id)
+
+
+class CountCacheTest(FoodgramTestCase):
+    """Кэш количества объектов для постраничной выдачи"""
+
+    def get_count(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data["count"]
+
+    def test_favorite_updates_own_count(self):
+        url = "/api/recipes/?is_favorited=1"
+        self.assertEqual(self.get_count(url), 0)
+        self.assertEqual(self.get_count("/api/recipes/"), 12)
+        generation = cache.get(COUNT_GENERATION_KEY)
+        response = self.client.post(
+            f"/api/recipes/{self.recipes[0].id}/favorite/"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_count(url), 1)
+        self.assertEqual(cache.get(COUNT_GENERATION_KEY), generation)
+
+    def test_shared_between_users(self):
+        self.get_count("/api/recipes/?tags=lunch")
+        self.client.force_authenticate(self.users[1])
+        with CaptureQueriesContext(connection) as queries:
+            self.get_count("/api/recipes/?tags=lunch")
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in queries)
+        )
+
+    def test_recipe_create_resets_counts(self):
+        self.assertEqual(self.get_count("/api/recipes/"), 12)
+        Recipe.objects.create(
+            author=self.user, name="Новый", text="Описание", cooking_time=5
+        )
+        self.assertEqual(self.get_count("/api/recipes/"), 13)
+
+
+class BulkToggleTest(FoodgramTestCase):
+    """Массовые действия меняют счетчики только для измененных связей"""
+
+    def get_statuses(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {"ids": ids}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item["status"] for item in response.data["results"]]
+
+    def test_favorite(self):
+        first, second = self.recipes[:2]
+        url = "/api/recipes/favorite/"
+        self.get_statuses("post", url, [first.id])
+        self.assertEqual(
+            self.get_statuses(
+                "post", url, [first.id, second.id, self.recipes[-1].id + 1]
+            ),
+            ["exists", "added", "not_found"],
+        )
+        self.assertEqual(
+            self.get_statuses("delete", url, [second.id, self.recipes[2].id]),
+            ["removed", "absent"],
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.favorites_count, 1)
+        self.assertEqual(second.favorites_count, 0)
+
+    def test_shopping_cart(self):
+        url = "/api/recipes/shopping_cart/"
+        ids = [recipe.id for recipe in self.recipes[:2]]
+        self.get_statuses("post", url, ids[:1])
+        self.get_statuses("post", url, ids)
+        self.assertEqual(
+            dict(
+                ShoppingListItem.objects.filter(user=self.user).values_list(
+                    "ingredient", "total_amount"
+                )
+            ),
+            {
+                self.ingredients[0].id: 20,
+                self.ingredients[1].id: 20,
+                self.ingredients[2].id: 10,
+            },
+        )
+
+    def test_subscribe(self):
+        url = "/api/users/subscribe/"
+        author = self.users[9]
+        self.assertEqual(
+            self.get_statuses(
+                "post", url, [self.users[1].id, author.id, self.user.id]
+            ),
+            ["exists", "added", "self"],
+        )
+        self.assertEqual(
+            self.get_statuses("delete", url, [author.id, self.users[10].id]),
+            ["removed", "absent"],
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+
+
+class ToggleTest(FoodgramTestCase):
+    """Ошибки добавления и удаления по одному объекту"""
+
+    def test_errors(self):
+        recipe = self.recipes[0]
+        unknown = self.recipes[-1].id + 1
+        for url in (
+            f"/api/recipes/{recipe.id}/favorite/",
+            f"/api/recipes/{recipe.id}/shopping_cart/",
+            f"/api/users/{self.users[9].id}/subscribe/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertEqual(self.client.delete(url).status_code, 400)
+        for url in (
+            f"/api/recipes/{unknown}/favorite/",
+            f"/api/recipes/{unknown}/shopping_cart/",
+            f"/api/users/{self.users[-1].id + 1}/subscribe/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 404)
+        response = self.client.post(f"/api/users/{self.user.id}/subscribe/")
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "Одновременные запросы проверяются только в PostgreSQL",
+)
+class ConcurrentToggleTest(APITransactionTestCase):
+    """Одновременные повторные нажатия добавляют связь один раз"""
+
+    threads = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.author = (
+            User.objects.create(
+                email=f"{username}@foodgram.ru",
+                username=username,
+                first_name="Имя",
+                last_name="Фамилия",
+            )
+            for username in ("user", "author")
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name="Рецепт", text="Описание", cooking_time=5
+        )
+        self.ingredient = Ingredient.objects.create(
+            name="ингредиент", measurement_unit="г"
+        )
+        IngredientInRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=10
+        )
+
+    def post_concurrently(self, url):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                statuses.append(client.post(url).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_double_click(self):
+        expected = [201] + [400] * (self.threads - 1)
+        for url in (
+            f"/api/recipes/{self.recipe.id}/favorite/",
+            f"/api/recipes/{self.recipe.id}/shopping_cart/",
+            f"/api/users/{self.author.id}/subscribe/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.post_concurrently(url), expected)
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(
+            list(
+                ShoppingListItem.objects.filter(user=self.user).values_list(
+                    "ingredient", "total_amount"
+                )
+            ),
+            [(self.ingredient.id, 10)],
+        )
+
+
+class RecipeFilterTest(FoodgramTestCase):
+    """Фильтры списка рецептов"""
+
+    def filter(self, **params):
+        request = RequestFactory().get("/api/recipes/", params)
+        request.user = self.user
+        return RecipeFilter(
+            request.GET,
+            queryset=Recipe.objects.order_by("-id"),
+            request=request,
+        ).qs
+
+    def test_tags_without_duplicates(self):
+        recipes = self.filter(tags=["breakfast", "lunch"])
+        ids = list(recipes.values_list("id", flat=True))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(
+            set(ids),
+            {
+                recipe.id
+                for recipe in self.recipes
+                if {tag.slug for tag in recipe.tags.all()}
+                & {"breakfast", "lunch"}
+            },
+        )
+
+    @skipUnless(
+        connection.vendor == "postgresql",
+        "Планы запросов проверяются только в PostgreSQL",
+    )
+    def test_indexes(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for params, index in (
+            ({"tags": ["breakfast"]}, "recipes_recipe_tags_tag_recipe_idx"),
+            ({"is_favorited": "1"}, "favorite_user_recipe_idx"),
+            ({"is_in_shopping_cart": "1"}, "recipes_shoppingcart"),
+        ):
+            with self.subTest(params=params):
+                plan = self.filter(**params).explain()
+                self.assertIn(index, plan)
+                self.assertNotIn("Seq Scan", plan)
+
+
+class ImportRecipesTest(FoodgramTestCase):
+    """Выгрузка и загрузка рецептов"""
+
+    def export_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recipes.jsonl")
+            call_command(
+                "export_recipes", "--output", path, stderr=StringIO()
+            )
+            call_command("import_recipes", path, stdout=StringIO())
+
+    def test_round_trip(self):
+        author = self.users[1]
+        self.export_import()
+        self.assertEqual(Recipe.objects.count(), 24)
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 4)
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=self.user, recipe__author=author
+            ).count(),
+            2,
+        )
+        original, copy = Recipe.objects.filter(
+            name=self.recipes[2].name
+        ).order_by("id")
+        self.assertEqual(
+            list(
+                copy.recipe_ingredients.order_by(
+                    "ingredient_id"
+                ).values_list("ingredient_id", "amount")
+            ),
+            list(
+                original.recipe_ingredients.order_by(
+                    "ingredient_id"
+                ).values_list("ingredient_id", "amount")
+            ),
+        )
+        self.assertEqual(
+            set(copy.tags.values_list("slug", flat=True)),
+            set(original.tags.values_list("slug", flat=True)),
+        )
+
+    def test_malformed_lines(self):
+        valid = {
+            "name": "Новый",
+            "text": "Описание",
+            "cooking_time": 5,
+            "author": self.users[1].email,
+            "tags": ["lunch"],
+            "ingredients": [
+                {"name": "ингредиент 0", "measurement_unit": "г", "amount": 3}
+            ],
+        }
+        lines = [
+            valid,
+            {key: value for key, value in valid.items() if key != "text"},
+            "{",
+            {**valid, "cooking_time": "долго"},
+            {**valid, "ingredients": [{"name": "ингредиент 0"}]},
+            {**valid, "ingredients": []},
+            [],
+            valid,
+        ]
+        stdout, stderr = StringIO(), StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recipes.jsonl")
+            with open(path, "w", encoding="utf-8") as file:
+                for line in lines:
+                    if not isinstance(line, str):
+                        line = json.dumps(line, ensure_ascii=False)
+                    file.write(line + "\n")
+            call_command(
+                "import_recipes",
+                path,
+                "--chunk-size",
+                "1",
+                stdout=stdout,
+                stderr=stderr,
+            )
+        self.assertEqual(Recipe.objects.filter(name="Новый").count(), 2)
+        self.assertIn("пропущено некорректных строк: 6", stdout.getvalue())
+        self.assertEqual(
+            [line.split()[1] for line in stderr.getvalue().splitlines()],
+            ["2", "3", "4", "5", "6", "7"],
+        )
+
+
+class LoadIngredientsTest(FoodgramTestCase):
+    """Загрузка ингредиентов: повторный запуск ничего не добавляет"""
+
+    rows = [
+        ["ингредиент 0", "г"],
+        [" соль ", " г "],
+        ["соль", "г"],
+        ["", "г"],
+        ["перец", "г"],
+    ]
+
+    def load(self, path):
+        stdout = StringIO()
+        call_command(
+            "load_ingredients", path, "--batch-size", "2", stdout=stdout
+        )
+        return stdout.getvalue().strip()
+
+    def check_load(self, path):
+        count = Ingredient.objects.count()
+        self.assertEqual(
+            self.load(path), "Добавлено ингредиентов: 2, пропущено: 2"
+        )
+        self.assertEqual(Ingredient.objects.count(), count + 2)
+        self.assertEqual(
+            [entry["name"] for entry in ingredient_index.search("соль")],
+            ["соль"],
+        )
+        self.assertEqual(
+            self.load(path), "Добавлено ингредиентов: 0, пропущено: 4"
+        )
+        self.assertEqual(Ingredient.objects.count(), count + 2)
+
+    def test_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ingredients.csv")
+            with open(path, "w", encoding="utf-8", newline="") as file:
+                csv.writer(file).writerows(self.rows)
+            self.check_load(path)
+
+    def test_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ingredients.json")
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(
+                    [
+                        {"name": name, "measurement_unit": measurement_unit}
+                        for name, measurement_unit in self.rows
+                    ],
+                    file,
+                    ensure_ascii=False,
+                )
+            self.check_load(path)
+
+
+class RecipeUpdateTest(FoodgramTestCase):
+    """Изменение рецепта с большим числом ингредиентов"""
+
+    def setUp(self):
+        super().setUp()
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=f"продукт {number:02}", measurement_unit="г")
+                for number in range(30)
+            ]
+        )
+        self.products = list(
+            Ingredient.objects.filter(name__startswith="продукт ")
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user, name="Большой", text="Описание", cooking_time=5
+        )
+        self.recipe.tags.set(self.tags[:2])
+        IngredientInRecipe.objects.bulk_create(
+            [
+                IngredientInRecipe(
+                    recipe=self.recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in self.products
+            ]
+        )
+
+    def test_update_query_count(self):
+        data = {
+            "tags": [tag.id for tag in self.tags],
+            "ingredients": [
+                {"id": ingredient.id, "amount": 20}
+                for ingredient in self.products
+            ],
+        }
+        url = f"/api/recipes/{self.recipe.id}/"
+        # рецепт с флагами, ингредиенты, теги, теги рецепта, новый тег,
+        # ингредиенты рецепта, их количества и savepoint теста
+        with self.assertNumQueries(9):
+            response = self.client.patch(url, data, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.client.get(url).data)
+        self.assertEqual(
+            {item["amount"] for item in response.data["ingredients"]}, {20}
+        )
+        self.assertEqual(len(response.data["tags"]), 3)
+
+    def test_partial_update(self):
+        url = f"/api/recipes/{self.recipe.id}/"
+        response = self.client.patch(
+            url, {"name": "Другое название"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.client.get(url).data)
+        self.assertEqual(len(response.data["ingredients"]), 30)
+
+    def test_create(self):
+        with tempfile.TemporaryDirectory() as media, self.settings(
+            MEDIA_ROOT=media
+        ):
+            self.check_create()
+
+    def check_create(self):
+        response = self.client.post(
+            "/api/recipes/",
+            {
+                "name": "Новый",
+                "text": "Описание",
+                "cooking_time": 5,
+                "image": IMAGE,
+                "tags": [self.tags[2].id, self.tags[0].id],
+                "ingredients": [
+                    {"id": ingredient.id, "amount": 15}
+                    for ingredient in self.products[:5]
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.data,
+            self.client.get(f"/api/recipes/{response.data['id']}/").data,
+        )
+
+    def test_unknown_tag(self):
+        response = self.client.patch(
+            f"/api/recipes/{self.recipe.id}/",
+            {"tags": [self.tags[-1].id + 1]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FeedTest(FoodgramTestCase):
+    """Лента подписок: заполнение при подписке, очистка при отписке
+    и переходы по страницам в обе стороны"""
+
+    def setUp(self):
+        super().setUp()
+        Follow.objects.filter(user=self.user).delete()
+        User.objects.filter(pk=self.users[4].id).update(followers_count=2000)
+        for author in self.users[1:5]:
+            response = self.client.post(f"/api/users/{author.id}/subscribe/")
+            self.assertEqual(response.status_code, 201)
+
+    def get_ids(self, authors):
+        return sorted(
+            (
+                recipe.id
+                for recipe in Recipe.objects.filter(author__in=authors)
+            ),
+            reverse=True,
+        )
+
+    def walk(self, url, link):
+        pages = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(
+                [recipe["id"] for recipe in response.data["results"]]
+            )
+            url = response.data[link]
+        return pages
+
+    def test_backfill_and_pull(self):
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 6
+        )
+        pages = self.walk("/api/recipes/feed/?limit=3", "next")
+        self.assertEqual(
+            sum(pages, []), self.get_ids(self.users[1:5])
+        )
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+
+    def test_previous(self):
+        response = self.client.get("/api/recipes/feed/?limit=3")
+        self.assertIsNone(response.data["previous"])
+        second = self.client.get(response.data["next"])
+        third = self.client.get(second.data["next"])
+        self.assertIsNone(third.data["next"])
+        pages = self.walk(third.data["previous"], "previous")
+        ids = self.get_ids(self.users[1:5])
+        self.assertEqual(pages, [ids[3:6], ids[:3]])
+
+    def test_prune_and_fan_out(self):
+        response = self.client.delete(
+            f"/api/users/{self.users[1].id}/subscribe/"
+        )
+        self.assertEqual(response.status_code, 204)
+        Recipe.objects.create(
+            author=self.users[2], name="Новый", text="Описание", cooking_time=5
+        )
+        pages = self.walk("/api/recipes/feed/?limit=10", "next")
+        self.assertEqual(pages, [self.get_ids(self.users[2:5])])
+
+
+class RecipeCacheTest(FoodgramTestCase):
+    """Кэш рецепта: попадание, сброс при изменении, признаки
+    пользователя поверх общих данных"""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+        self.url = f"/api/recipes/{self.recipe.id}/"
+
+    def test_hit(self):
+        first = self.client.get(self.url)
+        self.assertEqual(recipe_cache.stats()["misses"], 1)
+        second = self.client.get(f"/api/recipes/0{self.recipe.id}/")
+        self.assertEqual(recipe_cache.stats()["hits"], 1)
+        self.assertEqual(first.data, second.data)
+
+    def test_invalidate_on_edit(self):
+        self.client.force_authenticate(self.recipe.author)
+        self.client.get(self.url)
+        response = self.client.patch(
+            self.url, {"name": "Новое название"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["name"], "Новое название")
+        self.assertEqual(recipe_cache.stats()["hits"], 0)
+
+    def test_user_overlay(self):
+        self.client.get(self.url)
+        self.client.post(f"{self.url}favorite/")
+        favorited = self.client.get(self.url)
+        self.client.force_authenticate(self.users[10])
+        other = self.client.get(self.url)
+        self.assertEqual(recipe_cache.stats()["hits"], 2)
+        self.assertTrue(favorited.data["is_favorited"])
+        self.assertFalse(other.data["is_favorited"])
+        self.assertEqual(other.data["favorites_count"], 1)
+        self.assertTrue(favorited.data["author"]["is_subscribed"])
+        self.assertFalse(other.data["author"]["is_subscribed"])
+
+    def test_not_found(self):
+        for pk in ("abc", "0", "-1", "999999"):
+            with self.subTest(pk=pk):
+                response = self.client.get(f"/api/recipes/{pk}/")
+                self.assertEqual(response.status_code, 404)
+                key = recipe_cache.version_key.format(pk=pk)
+                self.assertIsNone(cache.get(key))
+
+
+class TokenCacheTest(FoodgramTestCase):
+    """Отозванный токен и измененный пользователь не читаются из кэша
+    токенов"""
+
+    url = "/api/users/me/"
+    password = "Старый-пароль-42"
+
+    def setUp(self):
+        super().setUp()
+        self.user.set_password(self.password)
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+    def test_logout(self):
+        response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_token_delete(self):
+        Token.objects.filter(key=self.token.key).delete()
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_set_password(self):
+        response = self.client.post(
+            "/api/users/set_password/",
+            {
+                "current_password": self.password,
+                "new_password": "Новый-пароль-42",
+            },
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_user_save(self):
+        self.user.first_name = "Другое"
+        self.user.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["first_name"], "Другое")
+
+    def test_last_login_keeps_cache(self):
+        self.user.save(update_fields=["last_login"])
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+    def test_admin_deactivate(self):
+        UserAdmin(User, admin.site).deactivate(
+            None, User.objects.filter(pk=self.user.pk)
+        )
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
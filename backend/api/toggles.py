@@ -0,0 +1,140 @@
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+
+class CountedToggle:
+    """
+    Связь пользователя с объектом (избранное, список покупок, подписка)
+    вместе со счетчиком на объекте. В PostgreSQL проверка, запись и
+    обновление счетчика выполняются одним запросом, повторное добавление
+    или удаление ничего не меняет и возвращает False. Методы для списков
+    возвращают только id, измененные этим вызовом
+    """
+
+    def __init__(self, model, field, counter):
+        self.model = model
+        self.field = model._meta.get_field(field)
+        self.counter = counter
+
+    @property
+    def target(self):
+        return self.field.related_model
+
+    def get_connection(self):
+        return connections[self.model.objects.db]
+
+    def add(self, user, target_id):
+        return bool(self.add_many(user, [target_id]))
+
+    def remove(self, user, target_id):
+        return bool(self.remove_many(user, [target_id]))
+
+    def add_many(self, user, target_ids):
+        """Возвращает id объектов, связь с которыми действительно
+        добавлена этим вызовом"""
+        if not target_ids:
+            return []
+        connection = self.get_connection()
+        if connection.vendor != "postgresql":
+            return self._add_fallback(user, target_ids)
+        fields = [
+            field
+            for field in self.model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        values = []
+        for target_id in target_ids:
+            instance = self.model(
+                user=user, **{self.field.attname: target_id}
+            )
+            values.extend(
+                field.get_db_prep_save(
+                    field.pre_save(instance, True), connection
+                )
+                for field in fields
+            )
+        quote = connection.ops.quote_name
+        columns = ", ".join(quote(field.column) for field in fields)
+        row = f"({', '.join(['%s'] * len(fields))})"
+        return self._execute(
+            connection,
+            f"INSERT INTO {quote(self.model._meta.db_table)} ({columns}) "
+            f"VALUES {', '.join([row] * len(target_ids))} "
+            f"ON CONFLICT DO NOTHING RETURNING {quote(self.field.column)}",
+            values,
+            f"{quote(self.counter)} + 1",
+        )
+
+    def remove_many(self, user, target_ids):
+        """Возвращает id объектов, связь с которыми действительно
+        удалена этим вызовом"""
+        if not target_ids:
+            return []
+        connection = self.get_connection()
+        if connection.vendor != "postgresql":
+            return self._remove_fallback(user, target_ids)
+        quote = connection.ops.quote_name
+        user_column = quote(self.model._meta.get_field("user").column)
+        column = quote(self.field.column)
+        return self._execute(
+            connection,
+            f"DELETE FROM {quote(self.model._meta.db_table)} "
+            f"WHERE {user_column} = %s AND {column} = ANY(%s) "
+            f"RETURNING {column}",
+            [user.id, list(target_ids)],
+            f"GREATEST({quote(self.counter)} - 1, 0)",
+        )
+
+    def _execute(self, connection, change_sql, params, counter_sql):
+        quote = connection.ops.quote_name
+        table = quote(self.target._meta.db_table)
+        pk = quote(self.target._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH changed AS ({change_sql}) "
+                f"UPDATE {table} SET {quote(self.counter)} = {counter_sql} "
+                f"WHERE {pk} IN "
+                f"(SELECT {quote(self.field.column)} FROM changed) "
+                f"RETURNING {pk}",
+                params,
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _add_fallback(self, user, target_ids):
+        changed = []
+        with transaction.atomic():
+            for target_id in target_ids:
+                try:
+                    with transaction.atomic():
+                        self.model.objects.create(
+                            user=user, **{self.field.attname: target_id}
+                        )
+                except IntegrityError:
+                    continue
+                changed.append(target_id)
+            self.target.objects.filter(pk__in=changed).update(
+                **{self.counter: F(self.counter) + 1}
+            )
+        return changed
+
+    def _remove_fallback(self, user, target_ids):
+        changed = []
+        with transaction.atomic():
+            for target_id in target_ids:
+                deleted, _ = self.model.objects.filter(
+                    user=user, **{self.field.attname: target_id}
+                ).delete()
+                if deleted:
+                    changed.append(target_id)
+            self.target.objects.filter(pk__in=changed).update(
+                **{self.counter: Greatest(F(self.counter) - 1, 0)}
+            )
+        return changed
+
+
+favorites = CountedToggle(Favorite, "recipe", "favorites_count")
+shopping_carts = CountedToggle(ShoppingCart, "recipe", "in_carts_count")
+follows = CountedToggle(Follow, "author", "followers_count")
@@ -1,4 +1,10 @@
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (
+    IngredientViewSet,
+    MetricsView,
+    RecipeViewSet,
+    TagViewSet,
+    UserViewSet,
+)
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -11,6 +17,7 @@ v1_router.register("ingredients", IngredientViewSet)
 v1_router.register("recipes", RecipeViewSet)
 
 urlpatterns = [
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     path("", include(v1_router.urls)),
     path("", include("djoser.urls")),
     path("auth/", include("djoser.urls.authtoken")),
@@ -1,13 +1,12 @@
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
-from django_filters.rest_framework import DjangoFilterBackend
-from djoser.views import UserViewSet
-from rest_framework import status, viewsets
-from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
-from rest_framework.response import Response
-
+from api import shopping_list
+from api.mixins import BulkIdsMixin, SubscriptionsContextMixin
 from api.permissions import AdminOrReadOnly, AuthorOrReadOnly
+from api.renderers import (
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+    PrometheusRenderer,
+    TextShoppingListRenderer,
+)
 from api.serializers import (
     CustomUserSerializer,
     FollowSerializer,
@@ -17,13 +16,46 @@ from api.serializers import (
     StrippedRecipeSerializer,
     TagSerializer,
 )
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from users.models import Follow, User
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import PageLimitPaginator
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django_filters.rest_framework import DjangoFilterBackend
+from djoser.views import UserViewSet
+from recipes.cache import recipe_cache
+from recipes.indexes import ingredient_index, pantry_index
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+    TimelineEntry,
+)
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (
+    SAFE_METHODS,
+    IsAdminUser,
+    IsAuthenticated,
+)
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.models import User
 
+from .filters import RecipeFilter
+from .metrics import metrics, render
+from .pagination import (
+    IdListCursorPaginator,
+    PageLimitPaginator,
+    PageOnlyPaginator,
+    UserPageLimitPaginator,
+    invalidate_counts,
+)
+from .toggles import favorites, follows, shopping_carts
 
-class UserViewSet(UserViewSet):
+
+class UserViewSet(BulkIdsMixin, SubscriptionsContextMixin, UserViewSet):
     """
     Работа с пользователями, подписка и отмена подписок на пользователей
     """
@@ -32,6 +64,16 @@ class UserViewSet(UserViewSet):
     serializer_class = CustomUserSerializer
     pagination_class = PageLimitPaginator
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get("recipes_limit")
+        if recipes_limit is None:
+            return None
+        if not recipes_limit.isdigit():
+            raise ValidationError(
+                {"recipes_limit": "Ожидается неотрицательное целое число"}
+            )
+        return int(recipes_limit)
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -39,29 +81,96 @@ class UserViewSet(UserViewSet):
     )
     def subscribe(self, request, **kwargs):
         user = request.user
-        author_id = self.kwargs.get("id")
-        author = get_object_or_404(User, id=author_id)
+        author = get_object_or_404(User, id=self.kwargs.get("id"))
 
         if request.method == "POST":
+            self.get_recipes_limit()
+            if author == user:
+                raise ValidationError(
+                    {"errors": "Нельзя подписаться на самого себя"}
+                )
+            with transaction.atomic():
+                if not follows.add(user, author.id):
+                    raise ValidationError(
+                        {"errors": "Вы уже подписаны на этого автора"}
+                    )
+                author.followers_count += 1
+                TimelineEntry.objects.backfill(user, [author])
+            invalidate_counts(request.user.id)
+            author.is_subscribed = True
             serializer = FollowSerializer(
-                author, data=request.data, context={"request": request}
+                author, context=self.get_serializer_context()
             )
-            serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=user, author=author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == "DELETE":
-            subscription = get_object_or_404(Follow, user=user, author=author)
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            if not follows.remove(user, author.id):
+                raise ValidationError(
+                    {"errors": "Вы не подписаны на этого автора"}
+                )
+            TimelineEntry.objects.prune(user, [author])
+        invalidate_counts(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="subscribe",
+        url_name="subscribe-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    def subscribe_bulk(self, request):
+        """Подписка и отписка сразу на нескольких авторов"""
+        user = request.user
+        ids = self.get_bulk_ids(request)
+        authors = User.objects.in_bulk(ids)
+        statuses = dict.fromkeys(ids, "not_found")
+        if request.method == "POST":
+            candidates = sorted(pk for pk in authors if pk != user.id)
+            statuses.update(dict.fromkeys(candidates, "exists"))
+            if user.id in authors:
+                statuses[user.id] = "self"
+            with transaction.atomic():
+                changed = follows.add_many(user, candidates)
+                for pk in changed:
+                    authors[pk].followers_count += 1
+                TimelineEntry.objects.backfill(
+                    user, [authors[pk] for pk in changed]
+                )
+            statuses.update(dict.fromkeys(changed, "added"))
+        else:
+            statuses.update(dict.fromkeys(authors, "absent"))
+            with transaction.atomic():
+                changed = follows.remove_many(user, sorted(authors))
+                TimelineEntry.objects.prune(user, changed)
+            statuses.update(dict.fromkeys(changed, "removed"))
+        invalidate_counts(request.user.id)
+        return self.get_bulk_response(ids, statuses)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=UserPageLimitPaginator,
+    )
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(following__user=user)
+        queryset = (
+            User.objects.filter(following__user=user)
+            .annotate(is_subscribed=Value(True, output_field=BooleanField()))
+            .order_by("-id")
+        )
+        recipes_limit = self.get_recipes_limit()
         pages = self.paginate_queryset(queryset)
+        author_recipes = Recipe.objects.group_by_author(
+            [author.id for author in pages], limit=recipes_limit
+        )
         serializer = FollowSerializer(
-            pages, many=True, context={"request": request}
+            pages,
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                "author_recipes": author_recipes,
+            },
         )
         return self.get_paginated_response(serializer.data)
 
@@ -82,10 +191,24 @@ class IngredientViewSet(viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = (AdminOrReadOnly,)
-    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение обслуживается индексом в памяти без запросов
+        к базе"""
+        limit = request.query_params.get("limit")
+        if limit is not None and not limit.isdigit():
+            raise ValidationError({"limit": "Ожидается целое число"})
+        return Response(
+            ingredient_index.search(
+                request.query_params.get("name", ""),
+                int(limit) if limit else None,
+            )
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    BulkIdsMixin, SubscriptionsContextMixin, viewsets.ModelViewSet
+):
     """
     Работа с рецептами(создание и редактирование), добавление рецептов
     в избранное, добавление в корзину и скачивание списка покупок
@@ -97,11 +220,72 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("update", "partial_update"):
+            return queryset.select_related("author").annotate_user_flags(
+                self.request.user
+            )
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return queryset.with_related().annotate_user_flags(self.request.user)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_pk(self):
+        """Ключ кэша всегда целое число: /api/recipes/01/ и
+        /api/recipes/1/ читают одну запись, мусор сразу дает 404"""
+        try:
+            pk = int(self.kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        if pk <= 0:
+            raise Http404
+        self.kwargs[self.lookup_field] = pk
+        return pk
+
+    def retrieve(self, request, *args, **kwargs):
+        """Общая часть рецепта берется из кэша, признаки пользователя
+        и счетчики подставляются одним запросом"""
+        pk = self.get_pk()
+        version = recipe_cache.get_version(pk)
+        data = recipe_cache.get(pk, version)
+        if data is None:
+            try:
+                recipe = self.get_object()
+            except Http404:
+                recipe_cache.discard(pk)
+                raise
+            data = self.get_serializer(recipe).data
+            recipe_cache.set(pk, version, data)
+            return Response(data)
+        overlay = (
+            Recipe.objects.filter(pk=pk)
+            .annotate_user_flags(request.user)
+            .values(
+                "is_favorited",
+                "is_in_shopping_cart",
+                "author_is_subscribed",
+                "favorites_count",
+                "in_carts_count",
+            )
+            .first()
+        )
+        if overlay is None:
+            raise Http404
+        author_is_subscribed = overlay.pop("author_is_subscribed")
+        if data["author"] is not None:
+            data["author"]["is_subscribed"] = author_is_subscribed
+        data.update(overlay)
+        return Response(data)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        recipe_cache.invalidate(instance.pk)
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -111,18 +295,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = self.get_object()
 
         if request.method == "POST":
+            if not favorites.add(request.user, recipe.id):
+                raise ValidationError({"errors": "Рецепт уже в избранном"})
+            invalidate_counts(request.user.id)
             serializer = StrippedRecipeSerializer(recipe)
-            Favorite.objects.create(user=request.user, recipe=recipe)
             return Response(
                 data=serializer.data, status=status.HTTP_201_CREATED
             )
 
-        if request.method == "DELETE":
-            favorite = Favorite.objects.filter(
-                user=request.user, recipe=recipe
-            )
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not favorites.remove(request.user, recipe.id):
+            raise ValidationError({"errors": "Рецепта нет в избранном"})
+        invalidate_counts(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -133,44 +317,232 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = self.get_object()
 
         if request.method == "POST":
-            ShoppingCart.objects.create(user=request.user, recipe=recipe)
+            with transaction.atomic():
+                if not shopping_carts.add(request.user, recipe.id):
+                    raise ValidationError(
+                        {"errors": "Рецепт уже в списке покупок"}
+                    )
+                ShoppingListItem.objects.add_recipes(
+                    [request.user.id], [recipe.id]
+                )
+            invalidate_counts(request.user.id)
             serializer = StrippedRecipeSerializer(recipe)
             return Response(
                 data=serializer.data, status=status.HTTP_201_CREATED
             )
 
-        if request.method == "DELETE":
-            shoppingcart = ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe
+        with transaction.atomic():
+            if not shopping_carts.remove(request.user, recipe.id):
+                raise ValidationError(
+                    {"errors": "Рецепта нет в списке покупок"}
+                )
+            ShoppingListItem.objects.remove_recipes(
+                [request.user.id], [recipe.id]
             )
-            shoppingcart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        invalidate_counts(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def toggle_many(self, request, toggle, on_change=None):
+        """Добавляет рецепты из списка в избранное или список покупок
+        либо удаляет их оттуда. on_change вызывается в той же транзакции
+        со списком рецептов, действительно измененных этим запросом"""
+        user = request.user
+        ids = self.get_bulk_ids(request)
+        found = sorted(
+            Recipe.objects.filter(id__in=ids).values_list("id", flat=True)
+        )
+        statuses = dict.fromkeys(ids, "not_found")
+        if request.method == "POST":
+            statuses.update(dict.fromkeys(found, "exists"))
+            with transaction.atomic():
+                changed = toggle.add_many(user, found)
+                if on_change is not None:
+                    on_change(changed)
+            statuses.update(dict.fromkeys(changed, "added"))
+        else:
+            statuses.update(dict.fromkeys(found, "absent"))
+            with transaction.atomic():
+                changed = toggle.remove_many(user, found)
+                if on_change is not None:
+                    on_change(changed)
+            statuses.update(dict.fromkeys(changed, "removed"))
+        invalidate_counts(request.user.id)
+        return self.get_bulk_response(ids, statuses)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="favorite",
+        url_name="favorite-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        """Добавление в избранное и удаление сразу нескольких рецептов"""
+        return self.toggle_many(request, favorites)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="shopping_cart",
+        url_name="shopping-cart-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_bulk(self, request):
+        """Добавление в список покупок и удаление сразу нескольких
+        рецептов"""
+        user_ids = [request.user.id]
+        if request.method == "POST":
+            update_list = ShoppingListItem.objects.add_recipes
+        else:
+            update_list = ShoppingListItem.objects.remove_recipes
+        return self.toggle_many(
+            request,
+            shopping_carts,
+            lambda changed: update_list(user_ids, changed),
+        )
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь"""
+        paginator = IdListCursorPaginator()
+        ids = paginator.paginate_ids(
+            lambda before, after, limit: TimelineEntry.objects.recipe_ids(
+                request.user, before, after, limit
+            ),
+            request,
+        )
+        recipes = (
+            Recipe.objects.filter(id__in=ids)
+            .with_related()
+            .annotate_user_flags(request.user)
+            .order_by("-id")
+        )
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, pagination_class=PageOnlyPaginator)
+    def popular(self, request):
+        """Рецепты по убыванию популярности с фильтрами списка рецептов"""
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .filter(popularity__isnull=False)
+            .order_by("-popularity__score", "-id")
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, pagination_class=PageOnlyPaginator)
+    def pantry(self, request):
+        """
+        Рецепты, которые можно приготовить из имеющихся ингредиентов:
+        сначала те, для которых есть все, затем с недостающими
+        """
+        ingredients = [
+            value
+            for param in request.query_params.getlist("ingredients")
+            for value in param.split(",")
+            if value
+        ]
+        max_missing = request.query_params.get("max_missing", "2")
+        if not ingredients or not all(map(str.isdigit, ingredients)):
+            raise ValidationError(
+                {"ingredients": "Ожидается список id ингредиентов"}
+            )
+        if not max_missing.isdigit():
+            raise ValidationError({"max_missing": "Ожидается целое число"})
+        found = pantry_index.search(
+            [int(value) for value in ingredients], int(max_missing)
+        )
+        page = self.paginate_queryset(found)
+        missing = {recipe_id: count for count, recipe_id in page}
+        recipes = self.get_queryset().filter(id__in=missing).in_bulk()
+        data = []
+        for recipe_id in missing:
+            if recipe_id in recipes:
+                item = self.get_serializer(recipes[recipe_id]).data
+                item["missing_count"] = missing[recipe_id]
+                data.append(item)
+        return self.get_paginated_response(data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Похожие рецепты, заранее рассчитанные командой
+        build_similar_recipes"""
+        if not pk.isdigit():
+            raise Http404
+        recipe = get_object_or_404(Recipe.objects.only("id"), pk=pk)
+        recipes = Recipe.objects.filter(similar_to__recipe=recipe).order_by(
+            "-similar_to__score", "-id"
+        )
+        serializer = StrippedRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(recipe_cache.stats())
 
     @action(
         detail=False,
         methods=["get"],
         permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            PDFShoppingListRenderer,
+        ],
     )
     def download_shopping_cart(self, request):
-        recipe_id = request.user.shopping_cart.values_list("recipe", flat=True)
-        ingredients = list(
-            Recipe.objects.filter(id__in=recipe_id).values_list(
-                "recipe_ingredients__ingredient__name",
-                "recipe_ingredients__ingredient__measurement_unit",
-                "recipe_ingredients__amount",
+        ingredients = (
+            ShoppingListItem.objects.filter(user=request.user)
+            .order_by("ingredient__name", "ingredient__measurement_unit")
+            .values_list(
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                "total_amount",
             )
         )
-        data = {}
-        for ingredient in ingredients:
-            if ingredient[0] in data:
-                data[ingredient[0]][0] += ingredient[2]
-            else:
-                data[ingredient[0]] = [ingredient[2], ingredient[1]]
-        result = ""
-        for key in data:
-            result += f"{key}: {data[key][0]}{data[key][1]}\n"
-        response = HttpResponse(result, content_type="text/plain")
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f"; charset={renderer.charset}"
+        response = StreamingHttpResponse(
+            shopping_list.RENDERERS[renderer.format](ingredients.iterator()),
+            content_type=content_type,
+        )
         response["Content-Disposition"] = (
-            "attachment;" 'filename="shopping_list.txt"'
+            "attachment;" f'filename="shopping_list.{renderer.format}"'
         )
         return response
+
+
+class MetricsView(APIView):
+    """Метрики запросов и кэша рецептов в формате Prometheus"""
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+    pagination_class = None
+
+    def get(self, request):
+        stats = recipe_cache.stats()
+        return Response(
+            render(
+                *metrics.collect(),
+                counters=[
+                    (
+                        "recipe_cache_hits_total",
+                        "Попадания в кэш рецептов",
+                        stats["hits"],
+                    ),
+                    (
+                        "recipe_cache_misses_total",
+                        "Промахи кэша рецептов",
+                        stats["misses"],
+                    ),
+                ],
+            )
+        )
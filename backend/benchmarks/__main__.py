@@ -0,0 +1,139 @@
+"""
+Замеры API на заполненной базе, запуск из каталога backend:
+
+    python manage.py seed_foodgram --users 1000 --seed 0
+    python -m benchmarks --output results.json
+
+Результат сравнивается с benchmarks/baseline.json, при регрессии
+команда завершается с кодом 1. Число запросов к базе сравнивается
+точно, медиана задержки и память с допуском --threshold. Задержки
+зависят от машины, поэтому базовые значения стоит записывать
+(--update-baseline) на той же машине, где выполняется сравнение.
+Если версия Python, СУБД или число рецептов отличаются от записанных
+в базовых значениях, сравнение не выполняется и команда завершается
+с кодом 2
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from pathlib import Path
+
+import django
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument(
+        "--memory-iterations",
+        type=int,
+        default=3,
+        help="Повторы с tracemalloc для замера памяти",
+    )
+    parser.add_argument(
+        "--only", nargs="+", metavar="NAME", help="Только эти сценарии"
+    )
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Допустимый рост медианы задержки и памяти, доля",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Записать результаты как базовые",
+    )
+    return parser.parse_args()
+
+
+def get_database_version(connection):
+    """Основная версия СУБД: у PostgreSQL номер выпуска, у SQLite
+    первые два числа версии библиотеки"""
+    if connection.vendor == "postgresql":
+        return str(connection.pg_version // 10000)
+    if connection.vendor == "sqlite":
+        return ".".join(connection.Database.sqlite_version.split(".")[:2])
+    return None
+
+
+def write_report(path, report):
+    with open(path, "w") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+        file.write("\n")
+
+
+def main():
+    options = parse_args()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    from .runner import compare, environment_mismatch, measure
+    from .scenarios import Fixture, build_scenarios
+
+    fixture = Fixture()
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {fixture.token}")
+    scenarios = [
+        scenario
+        for scenario in build_scenarios(fixture, client)
+        if not options.only or scenario.name in options.only
+    ]
+    results = {}
+    with tempfile.TemporaryDirectory() as media, override_settings(
+        MEDIA_ROOT=media
+    ):
+        for scenario in scenarios:
+            results[scenario.name] = measure(
+                client,
+                scenario,
+                options.iterations,
+                options.warmup,
+                options.memory_iterations,
+            )
+            print(scenario.name, results[scenario.name])
+    report = {
+        "meta": {
+            "python": ".".join(platform.python_version_tuple()[:2]),
+            "database": connection.vendor,
+            "database_version": get_database_version(connection),
+            "recipes": fixture.recipe_count,
+            "iterations": options.iterations,
+        },
+        "scenarios": results,
+    }
+    if options.output:
+        write_report(options.output, report)
+    if options.update_baseline:
+        write_report(options.baseline, report)
+        return 0
+    if not os.path.exists(options.baseline):
+        return 0
+    with open(options.baseline) as file:
+        baseline = json.load(file)
+    mismatch = environment_mismatch(report["meta"], baseline["meta"])
+    if mismatch:
+        print("Базовые значения сняты в другом окружении:", file=sys.stderr)
+        for line in mismatch:
+            print(line, file=sys.stderr)
+        return 2
+    regressions = compare(results, baseline["scenarios"], options.threshold)
+    for regression in regressions:
+        print(regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
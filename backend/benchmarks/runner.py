@@ -0,0 +1,124 @@
+import math
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from api.middleware import QueryTimer
+from django.db import connections
+
+ENVIRONMENT = ("python", "database", "database_version", "recipes")
+
+
+def percentile(values, share):
+    """Значение, не меньше которого share значений"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def timed(function):
+    """Результат, время выполнения и число запросов к базе"""
+    timer = QueryTimer()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+    return result, elapsed, timer.count
+
+
+def send(client, method, path, data):
+    if data is None:
+        response = getattr(client, method)(path)
+    else:
+        response = getattr(client, method)(path, data, format="json")
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def request(client, scenario):
+    if scenario.call is not None:
+        _, elapsed, count = timed(scenario.call)
+        return elapsed, count
+    path, data = scenario.prepare()
+    response, elapsed, count = timed(
+        lambda: send(client, scenario.method, path, data)
+    )
+    if response.status_code >= 400:
+        raise RuntimeError(
+            f"{scenario.name}: {response.status_code} "
+            f"{response.content.decode()}"
+        )
+    if scenario.after is not None:
+        scenario.after(response)
+    return elapsed, count
+
+
+def measure(client, scenario, iterations, warmup, memory_iterations):
+    """
+    Задержки и число запросов к базе для iterations повторов после
+    warmup прогревочных. Память меряется отдельными повторами, так как
+    tracemalloc замедляет работу в несколько раз
+    """
+    try:
+        for _ in range(warmup):
+            request(client, scenario)
+        durations = []
+        queries = []
+        for _ in range(iterations):
+            elapsed, count = request(client, scenario)
+            durations.append(elapsed)
+            queries.append(count)
+        peaks = []
+        for _ in range(memory_iterations):
+            tracemalloc.start()
+            try:
+                request(client, scenario)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+    finally:
+        if scenario.teardown is not None:
+            scenario.teardown()
+    return {
+        "p50_ms": round(percentile(durations, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(durations, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+        "queries": max(queries),
+        "memory_kb": round(max(peaks, default=0) / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий относительно baseline. Число запросов не должно
+    расти вовсе, медиана задержки и память не более чем в 1 + threshold
+    раз. p95 и p99 только выводятся, на общей машине они слишком шумные"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                f"{name}: запросов {result['queries']}, "
+                f"было {expected['queries']}"
+            )
+        for key in ("p50_ms", "memory_kb"):
+            if result[key] > expected[key] * (1 + threshold):
+                regressions.append(
+                    f"{name}: {key} {result[key]}, было {expected[key]}"
+                )
+    return regressions
+
+
+def environment_mismatch(meta, baseline_meta):
+    """Различия окружения замера и базовых значений. С другой версией
+    Python, другой СУБД или другим объемом данных сравнение
+    бессмысленно, в том числе по числу запросов"""
+    return [
+        f"{key}: {meta.get(key)}, в базовых значениях "
+        f"{baseline_meta.get(key)}"
+        for key in ENVIRONMENT
+        if meta.get(key) != baseline_meta.get(key)
+    ]
@@ -0,0 +1,188 @@
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from django.db.models import Count
+from recipes.indexes import pantry_index
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+class Scenario:
+    """
+    Запрос, время которого измеряется. Обработчики выполняются вне
+    измерений: setup перед каждым запросом и возвращает путь и данные,
+    after получает ответ, teardown вызывается после всех повторов.
+    Вместо запроса к API можно измерять функцию call без аргументов
+    """
+
+    def __init__(
+        self,
+        name,
+        path=None,
+        method="get",
+        data=None,
+        setup=None,
+        after=None,
+        teardown=None,
+        call=None,
+    ):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.setup = setup
+        self.after = after
+        self.teardown = teardown
+        self.call = call
+
+    def prepare(self):
+        if self.setup is None:
+            return self.path, self.data
+        return self.setup()
+
+
+class Fixture:
+    """Пользователь и объекты из заполненной базы, на которых
+    выполняются сценарии"""
+
+    def __init__(self):
+        self.user = (
+            User.objects.annotate(follows=Count("follower"))
+            .order_by("-follows", "id")
+            .first()
+        )
+        if self.user is None:
+            raise RuntimeError(
+                "База пуста, заполните ее командой seed_foodgram"
+            )
+        self.token = Token.objects.get_or_create(user=self.user)[0].key
+        self.recipe = Recipe.objects.order_by("-favorites_count", "id").first()
+        self.recipe_count = Recipe.objects.count()
+        self.tags = list(
+            Tag.objects.order_by("id").values_list("id", "slug")[:2]
+        )
+        self.ingredients = list(
+            self.recipe.recipe_ingredients.order_by("ingredient_id")
+            .values_list("ingredient_id", flat=True)
+        )
+        self.prefix = Ingredient.objects.order_by("id").first().name[:3]
+
+    def recipe_data(self, amount=10):
+        return {
+            "name": "Рецепт для замеров",
+            "text": "Описание",
+            "cooking_time": 10,
+            "image": IMAGE,
+            "tags": [pk for pk, _ in self.tags],
+            "ingredients": [
+                {"id": pk, "amount": amount} for pk in self.ingredients
+            ],
+        }
+
+
+def with_limit(url, limit):
+    """Путь ссылки на страницу с другим размером страницы"""
+    parts = urlsplit(url)
+    params = parse_qs(parts.query, keep_blank_values=True)
+    params["limit"] = [limit]
+    return f"{parts.path}?{urlencode(params, doseq=True)}"
+
+
+def build_scenarios(fixture, client):
+    tags = "&".join(f"tags={slug}" for _, slug in fixture.tags)
+    pantry = fixture.ingredients[:-1]
+    ingredients = ",".join(map(str, pantry))
+    deep_page = max(fixture.recipe_count // 6 * 9 // 10, 1)
+    deep_cursor = []
+    created = []
+    amounts = iter(range(1, 10 ** 9))
+
+    def follow_cursor():
+        """Переходит по ссылкам next до той же позиции, что и
+        recipe_list_deep_page, крупными страницами, один раз"""
+        if not deep_cursor:
+            link = "/api/recipes/?cursor="
+            remaining = (deep_page - 1) * 6
+            while remaining:
+                step = min(remaining, 100)
+                link = client.get(with_limit(link, step)).data["next"]
+                remaining -= step
+            deep_cursor.append(with_limit(link, 6))
+        return deep_cursor[0], None
+
+    def remember(response):
+        created.append(response.data["id"])
+
+    def delete_recipes():
+        while created:
+            client.delete(f"/api/recipes/{created.pop()}/")
+
+    def update_data():
+        if not created:
+            remember(
+                client.post(
+                    "/api/recipes/", fixture.recipe_data(), format="json"
+                )
+            )
+        return (
+            f"/api/recipes/{created[0]}/",
+            fixture.recipe_data(amount=next(amounts) % 100 + 10),
+        )
+
+    return [
+        Scenario("recipe_list", "/api/recipes/?limit=6"),
+        Scenario("recipe_list_tags", f"/api/recipes/?limit=6&{tags}"),
+        Scenario(
+            "recipe_list_favorited", "/api/recipes/?limit=6&is_favorited=1"
+        ),
+        Scenario(
+            "recipe_list_in_cart",
+            "/api/recipes/?limit=6&is_in_shopping_cart=1",
+        ),
+        Scenario(
+            "recipe_list_deep_page", f"/api/recipes/?limit=6&page={deep_page}"
+        ),
+        Scenario("recipe_list_deep_cursor", setup=follow_cursor),
+        Scenario("recipe_detail", f"/api/recipes/{fixture.recipe.id}/"),
+        Scenario(
+            "subscriptions", "/api/users/subscriptions/?recipes_limit=3"
+        ),
+        Scenario(
+            "ingredient_autocomplete",
+            f"/api/ingredients/?{urlencode({'name': fixture.prefix})}",
+        ),
+        Scenario(
+            "pantry", f"/api/recipes/pantry/?ingredients={ingredients}"
+        ),
+        Scenario("pantry_index", call=lambda: pantry_index.search(pantry, 2)),
+        Scenario(
+            "pantry_sql",
+            call=lambda: list(
+                Recipe.objects.by_pantry(pantry, 2).values_list(
+                    "missing", "id"
+                )
+            ),
+        ),
+        Scenario(
+            "download_shopping_cart", "/api/recipes/download_shopping_cart/"
+        ),
+        Scenario(
+            "recipe_create",
+            "/api/recipes/",
+            method="post",
+            data=fixture.recipe_data(),
+            after=remember,
+            teardown=delete_recipes,
+        ),
+        Scenario(
+            "recipe_update",
+            method="patch",
+            setup=update_data,
+            teardown=delete_recipes,
+        ),
+    ]
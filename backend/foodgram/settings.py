@@ -6,6 +6,16 @@ MIN_COOKING_TIME = 1
 DEFAULT_COOKING_TIME = 1
 MAX_AMOUNT_WEIGHT_PRODUCT = 3000
 MIN_AMOUNT_WEIGHT_PRODUCT = 1
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+PAGINATION_ESTIMATED_COUNT_THRESHOLD = None
+RECIPE_CACHE_TIMEOUT = 60 * 15
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_BACKFILL_SIZE = 50
+POPULARITY_HALF_LIFE_DAYS = 7
+SIMILAR_RECIPES_COUNT = 10
+BULK_MAX_IDS = 100
+METRICS_MULTIPROCESS_DIR = os.getenv("METRICS_MULTIPROCESS_DIR")
+METRICS_FLUSH_INTERVAL = 1
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -27,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "corsheaders",
@@ -39,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -81,6 +93,15 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -117,7 +138,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -128,6 +149,11 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
     ],
+    "TOKEN_CACHE": {
+        "LOCAL_SIZE": 1024,
+        "LOCAL_TIMEOUT": 10,
+        "TIMEOUT": 60,
+    },
 }
 
 DJOSER = {
@@ -142,5 +168,10 @@ DJOSER = {
     },
 }
 
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    "SHOPPING_LIST_PDF_FONT",
+    default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
@@ -2,12 +2,15 @@ from django.contrib import admin
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from .cache import recipe_cache
+from .indexes import ingredient_index
 from .models import (
     Favorite,
     Ingredient,
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
@@ -23,9 +26,36 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",
         "id",
         "author",
+        "favorites_count",
+        "in_carts_count",
     )
     inlines = (RecipeIngredientInline,)
 
+    def save_related(self, request, form, formsets, change):
+        """Ингредиенты рецепта меняются во вложенной форме, суммы
+        в списках покупок пересчитываются как при изменении через API"""
+        recipe = form.instance
+        cart_users = list(
+            recipe.in_shopping_cart.order_by().values_list("user", flat=True)
+        )
+        if cart_users:
+            ShoppingListItem.objects.remove_recipes(cart_users, [recipe.pk])
+        super().save_related(request, form, formsets, change)
+        if cart_users:
+            ShoppingListItem.objects.add_recipes(cart_users, [recipe.pk])
+        recipe_cache.invalidate(recipe.pk)
+
+    def delete_model(self, request, obj):
+        pk = obj.pk
+        super().delete_model(request, obj)
+        recipe_cache.invalidate(pk)
+
+    def delete_queryset(self, request, queryset):
+        pks = list(queryset.values_list("pk", flat=True))
+        super().delete_queryset(request, queryset)
+        for pk in pks:
+            recipe_cache.invalidate(pk)
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -44,6 +74,15 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = (
+        "user",
+        "ingredient",
+        "total_amount",
+    )
+
+
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = (
@@ -73,6 +112,13 @@ class IngredientResourse(resources.ModelResource):
             "measurement_unit",
         )
 
+    def after_import(self, dataset, result, using_transactions, dry_run, **kw):
+        super().after_import(
+            dataset, result, using_transactions, dry_run, **kw
+        )
+        if not dry_run:
+            ingredient_index.invalidate()
+
 
 @admin.register(Ingredient)
 class IngredientAdmin(ImportExportModelAdmin):
@@ -0,0 +1,70 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class RecipeCache:
+    """
+    Кэш не зависящей от пользователя части представления рецепта.
+    У каждого рецепта своя версия, при изменении рецепта она меняется
+    и старые записи больше не читаются. С LocMemCache по умолчанию
+    версия меняется только в процессе, изменившем рецепт, остальные
+    отдают старые данные до RECIPE_CACHE_TIMEOUT секунд, поэтому
+    в работе нужен общий кэш (CACHE_BACKEND и CACHE_LOCATION)
+    """
+
+    version_key = "recipe:{pk}:version"
+    data_key = "recipe:{pk}:v{version}"
+    hits_key = "recipe_cache:hits"
+    misses_key = "recipe_cache:misses"
+
+    def get_version(self, pk):
+        key = self.version_key.format(pk=pk)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(key)
+        return version
+
+    def invalidate(self, pk):
+        cache.set(
+            self.version_key.format(pk=pk), uuid.uuid4().hex, timeout=None
+        )
+
+    def discard(self, pk):
+        """Версия несуществующего рецепта не должна оставаться в кэше
+        навсегда"""
+        cache.delete(self.version_key.format(pk=pk))
+
+    def get(self, pk, version):
+        data = cache.get(self.data_key.format(pk=pk, version=version))
+        self._count(self.misses_key if data is None else self.hits_key)
+        return data
+
+    def set(self, pk, version, data):
+        """Версия должна быть прочитана до загрузки рецепта из базы,
+        иначе изменение между чтением и записью останется в кэше"""
+        cache.set(
+            self.data_key.format(pk=pk, version=version),
+            data,
+            timeout=settings.RECIPE_CACHE_TIMEOUT,
+        )
+
+    def stats(self):
+        counters = cache.get_many([self.hits_key, self.misses_key])
+        hits = counters.get(self.hits_key, 0)
+        misses = counters.get(self.misses_key, 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else None,
+        }
+
+    @staticmethod
+    def _count(key):
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+recipe_cache = RecipeCache()
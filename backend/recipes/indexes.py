@@ -0,0 +1,233 @@
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Ingredient, IngredientInRecipe, Tag
+
+
+class VersionedIndex:
+    """
+    Индекс в памяти процесса. Версия хранится в кэше Django, при ее смене
+    индекс перестраивается при следующем обращении. Изменения видны
+    другим процессам, только если кэш общий (CACHE_BACKEND и
+    CACHE_LOCATION), с LocMemCache по умолчанию каждый процесс
+    сбрасывает только свой индекс. Индекс строится при первом обращении,
+    а не при запуске процесса, чтобы migrate и другие команды не читали
+    базу
+    """
+
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def invalidate(self):
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+
+    def get(self):
+        version = self.get_version()
+        if self._data is None or self._version != version:
+            with self._lock:
+                if self._data is None or self._version != version:
+                    self._data = self.build()
+                    self._version = version
+        return self._data
+
+
+class IngredientIndex(VersionedIndex):
+    """
+    Поиск ингредиентов для автодополнения без обращения к базе:
+    сначала совпадения по началу названия, затем по подстроке
+    """
+
+    version_key = "ingredient_index_version"
+
+    def build(self):
+        rows = Ingredient.objects.values_list("id", "name", "measurement_unit")
+        entries = sorted(
+            (
+                {"id": pk, "name": name, "measurement_unit": measurement_unit}
+                for pk, name, measurement_unit in rows
+            ),
+            key=lambda entry: (
+                entry["name"].lower(),
+                entry["measurement_unit"],
+                entry["id"],
+            ),
+        )
+        return [entry["name"].lower() for entry in entries], entries
+
+    def search(self, query, limit=None):
+        keys, entries = self.get()
+        query = query.lower()
+        if not query:
+            return entries[:limit]
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + "\uffff", lo=start)
+        result = entries[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        matches = []
+        for position, key in enumerate(keys):
+            if start <= position < end:
+                continue
+            found = key.find(query, 1)
+            if found > 0:
+                word_start = key[found - 1] in " -,("
+                matches.append((not word_start, found, len(key), position))
+        matches.sort()
+        result.extend(entries[match[-1]] for match in matches)
+        return result[:limit]
+
+
+class TagIndex(VersionedIndex):
+    """Соответствие slug тегов их id для фильтрации рецептов"""
+
+    version_key = "tag_index_version"
+
+    def build(self):
+        return dict(Tag.objects.values_list("slug", "id"))
+
+    def get_ids(self, slugs):
+        ids = self.get()
+        return [ids[slug] for slug in slugs if slug in ids]
+
+
+class PantryIndex(VersionedIndex):
+    """
+    Инвертированный индекс ингредиент -> отсортированный массив id
+    рецептов для поиска рецептов по имеющимся продуктам. Изменения
+    рецептов записываются в журнал в кэше Django, по нему каждый процесс
+    обновляет только изменившиеся рецепты. Если журнал потерян, индекс
+    перестраивается целиком
+    """
+
+    version_key = "pantry_index_version"
+    sequence_key = "pantry_index_sequence"
+    change_key = "pantry_index_change:{}"
+    change_timeout = 60 * 60
+    chunk_size = 50000
+
+    def __init__(self):
+        super().__init__()
+        self._sequence = 0
+
+    def build(self):
+        self._sequence = cache.get(self.sequence_key, 0)
+        recipes = defaultdict(list)
+        postings = defaultdict(list)
+        last_id = 0
+        while True:
+            rows = list(
+                IngredientInRecipe.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "recipe_id", "ingredient_id")[
+                    : self.chunk_size
+                ]
+            )
+            if not rows:
+                break
+            for _, recipe_id, ingredient_id in rows:
+                recipes[recipe_id].append(ingredient_id)
+                postings[ingredient_id].append(recipe_id)
+            last_id = rows[-1][0]
+        return (
+            {pk: array("l", sorted(ids)) for pk, ids in postings.items()},
+            {pk: tuple(sorted(ids)) for pk, ids in recipes.items()},
+        )
+
+    def get(self):
+        data = super().get()
+        sequence = cache.get(self.sequence_key, 0)
+        if sequence != self._sequence:
+            with self._lock:
+                if sequence != self._sequence:
+                    data = self.apply_changes(data, sequence)
+        return data
+
+    def apply_changes(self, data, sequence):
+        keys = [
+            self.change_key.format(number)
+            for number in range(self._sequence + 1, sequence + 1)
+        ]
+        changed = cache.get_many(keys)
+        if sequence < self._sequence or len(changed) < len(keys):
+            self._data = data = self.build()
+            return data
+        postings, recipes = data
+        current = defaultdict(tuple)
+        for recipe_id, ingredient_id in (
+            IngredientInRecipe.objects.filter(recipe_id__in=changed.values())
+            .order_by("recipe_id", "ingredient_id")
+            .values_list("recipe_id", "ingredient_id")
+        ):
+            current[recipe_id] += (ingredient_id,)
+        for recipe_id in set(changed.values()):
+            old = set(recipes.get(recipe_id, ()))
+            new = set(current[recipe_id])
+            for ingredient_id in old - new:
+                posting = array("l", postings[ingredient_id])
+                del posting[bisect_left(posting, recipe_id)]
+                postings[ingredient_id] = posting
+            for ingredient_id in new - old:
+                posting = array("l", postings.get(ingredient_id, ()))
+                posting.insert(bisect_left(posting, recipe_id), recipe_id)
+                postings[ingredient_id] = posting
+            if new:
+                recipes[recipe_id] = current[recipe_id]
+            else:
+                recipes.pop(recipe_id, None)
+        self._sequence = sequence
+        return data
+
+    def recipe_changed(self, recipe_id):
+        """Записывает изменение ингредиентов рецепта в журнал после
+        фиксации транзакции"""
+
+        def record():
+            cache.add(self.sequence_key, 0, timeout=None)
+            cache.set(
+                self.change_key.format(cache.incr(self.sequence_key)),
+                recipe_id,
+                timeout=self.change_timeout,
+            )
+
+        transaction.on_commit(record)
+
+    def search(self, ingredient_ids, max_missing=0):
+        """Рецепты, в которых есть хотя бы один из ингредиентов и
+        недостает не больше max_missing, в виде пар (недостает, id
+        рецепта): сначала полностью доступные, затем новые"""
+        postings, recipes = self.get()
+        available = Counter()
+        for ingredient_id in set(ingredient_ids):
+            available.update(postings.get(ingredient_id, ()))
+        result = []
+        for recipe_id, count in available.items():
+            ingredients = recipes.get(recipe_id)
+            if ingredients and len(ingredients) - count <= max_missing:
+                result.append((len(ingredients) - count, -recipe_id))
+        result.sort()
+        return [(missing, -recipe_id) for missing, recipe_id in result]
+
+
+ingredient_index = IngredientIndex()
+tag_index = TagIndex()
+pantry_index = PantryIndex()
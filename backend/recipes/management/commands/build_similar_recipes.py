@@ -0,0 +1,81 @@
+import os
+import time
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from recipes.models import RecipeSimilarity
+from recipes.similarity import IncidenceMatrix, init_worker, top_similar
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает похожие рецепты по коэффициенту Жаккара "
+        "для множеств ингредиентов и тегов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=settings.SIMILAR_RECIPES_COUNT,
+            help="Количество похожих рецептов для каждого рецепта",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=64,
+            help=(
+                "Количество рецептов, обрабатываемых за один шаг; "
+                "память шага пропорциональна block-size x число рецептов"
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Количество процессов",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Размер пачки для bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix = IncidenceMatrix.load()
+        count = len(matrix.recipe_ids)
+        block_size = options["block_size"]
+        blocks = [
+            (start, min(start + block_size, count), options["top_k"])
+            for start in range(0, count, block_size)
+        ]
+        connections.close_all()
+        saved = 0
+        with transaction.atomic():
+            RecipeSimilarity.objects.all().delete()
+            with Pool(
+                options["workers"], initializer=init_worker, initargs=(matrix,)
+            ) as pool:
+                for rows in pool.imap(top_similar, blocks):
+                    RecipeSimilarity.objects.bulk_create(
+                        [
+                            RecipeSimilarity(
+                                recipe_id=recipe_id,
+                                similar_id=similar_id,
+                                score=score,
+                            )
+                            for recipe_id, similar_id, score in rows
+                        ],
+                        batch_size=options["batch_size"],
+                    )
+                    saved += len(rows)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Рецептов: {count}, сохранено пар: {saved} "
+                f"за {time.monotonic() - started:.1f} с"
+            )
+        )
@@ -0,0 +1,74 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Выгружает рецепты в формате JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="Файл для выгрузки, по умолчанию stdout",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество рецептов, читаемых из базы за один запрос",
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        started = time.monotonic()
+        if output == "-":
+            exported = self.export(sys.stdout, options["chunk_size"])
+        else:
+            with open(output, "w", encoding="utf-8") as file:
+                exported = self.export(file, options["chunk_size"])
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            f"Выгружено рецептов: {exported} за {elapsed:.1f} с "
+            f"({exported / max(elapsed, 1e-6):.0f} в секунду)"
+        )
+
+    def export(self, file, chunk_size):
+        exported = 0
+        last_id = 0
+        while True:
+            chunk = list(
+                Recipe.objects.with_related()
+                .filter(id__gt=last_id)
+                .order_by("id")[:chunk_size]
+            )
+            if not chunk:
+                return exported
+            file.writelines(
+                json.dumps(self.serialize(recipe), ensure_ascii=False) + "\n"
+                for recipe in chunk
+            )
+            exported += len(chunk)
+            last_id = chunk[-1].id
+
+    @staticmethod
+    def serialize(recipe):
+        return {
+            "name": recipe.name,
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+            "image": recipe.image.name,
+            "author": recipe.author.email if recipe.author else None,
+            "tags": [tag.slug for tag in recipe.tags.all()],
+            "ingredients": [
+                {
+                    "name": item.ingredient.name,
+                    "measurement_unit": item.ingredient.measurement_unit,
+                    "amount": item.amount,
+                }
+                for item in recipe.recipe_ingredients.all()
+            ],
+        }
@@ -0,0 +1,243 @@
+import json
+import time
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import F
+from recipes.indexes import ingredient_index, pantry_index
+from recipes.models import (
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    Tag,
+    TimelineEntry,
+)
+from users.models import User
+
+
+def clean_fields(model, data, names):
+    """Значения проверяются и приводятся к типам полей модели"""
+    return {
+        name: model._meta.get_field(name).clean(data.get(name), None)
+        for name in names
+    }
+
+
+def clean_ingredient(item):
+    if not isinstance(item, dict):
+        raise ValidationError("Ингредиент должен быть объектом")
+    return {
+        **clean_fields(Ingredient, item, ("name", "measurement_unit")),
+        **clean_fields(IngredientInRecipe, item, ("amount",)),
+    }
+
+
+def clean_record(record):
+    """
+    Запись из файла в виде, пригодном для сохранения. Ошибка в любом
+    поле делает некорректной всю запись
+    """
+    if not isinstance(record, dict):
+        raise ValidationError("Рецепт должен быть объектом")
+    cleaned = clean_fields(Recipe, record, ("name", "text", "cooking_time"))
+    for name in ("author", "image"):
+        if not isinstance(record.get(name) or "", str):
+            raise ValidationError(f"Поле {name} должно быть строкой")
+    tags = record.get("tags") or []
+    if not isinstance(tags, list) or not all(
+        isinstance(slug, str) for slug in tags
+    ):
+        raise ValidationError("Теги должны быть списком строк")
+    ingredients = record.get("ingredients")
+    if not isinstance(ingredients, list) or not ingredients:
+        raise ValidationError("Нужен непустой список ингредиентов")
+    return {
+        **cleaned,
+        "author": record.get("author"),
+        "image": record.get("image") or "",
+        "tags": tags,
+        "ingredients": [clean_ingredient(item) for item in ingredients],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает рецепты из файла JSON Lines, созданного командой "
+        "export_recipes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл с рецептами")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Количество рецептов, сохраняемых за одну транзакцию",
+        )
+
+    def handle(self, *args, **options):
+        self.tags = dict(Tag.objects.values_list("slug", "id"))
+        self.ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                "id", "name", "measurement_unit"
+            )
+        }
+        self.authors = {}
+        self.created_ingredients = 0
+        self.skipped_tags = 0
+        self.skipped_records = 0
+        imported = 0
+        started = time.monotonic()
+        chunk = []
+        with open(options["path"], encoding="utf-8") as file:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                record = self.read_record(number, line)
+                if record is None:
+                    continue
+                chunk.append(record)
+                if len(chunk) >= options["chunk_size"]:
+                    imported += self.import_chunk(chunk)
+                    chunk = []
+                    self.report(imported, started)
+            if chunk:
+                imported += self.import_chunk(chunk)
+        if self.created_ingredients:
+            ingredient_index.invalidate()
+        if imported:
+            pantry_index.invalidate()
+        self.report(imported, started)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Загружено рецептов: {imported}, новых ингредиентов: "
+                f"{self.created_ingredients}, пропущено неизвестных тегов: "
+                f"{self.skipped_tags}, пропущено некорректных строк: "
+                f"{self.skipped_records}"
+            )
+        )
+
+    def read_record(self, number, line):
+        """Некорректная строка пропускается целиком, чтобы ошибка
+        не прерывала загрузку после сохранения предыдущих частей"""
+        try:
+            return clean_record(json.loads(line))
+        except json.JSONDecodeError as error:
+            message = str(error)
+        except ValidationError as error:
+            message = "; ".join(error.messages)
+        self.skipped_records += 1
+        self.stderr.write(f"Строка {number} пропущена: {message}")
+        return None
+
+    def report(self, imported, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{imported} рецептов за {elapsed:.1f} с "
+            f"({imported / max(elapsed, 1e-6):.0f} в секунду)"
+        )
+
+    def resolve_authors(self, records):
+        emails = {
+            record["author"]
+            for record in records
+            if record.get("author") and record["author"] not in self.authors
+        }
+        if emails:
+            self.authors.update(
+                User.objects.filter(email__in=emails).values_list(
+                    "email", "id"
+                )
+            )
+
+    def resolve_ingredients(self, records):
+        missing = {
+            (item["name"], item["measurement_unit"])
+            for record in records
+            for item in record["ingredients"]
+        } - self.ingredients.keys()
+        if not missing:
+            return
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in missing
+            ],
+            ignore_conflicts=True,
+        )
+        self.created_ingredients += len(missing)
+        for pk, name, measurement_unit in Ingredient.objects.filter(
+            name__in={name for name, _ in missing}
+        ).values_list("id", "name", "measurement_unit"):
+            self.ingredients[(name, measurement_unit)] = pk
+
+    def create_recipes(self, recipes):
+        """bulk_create не отправляет post_save, поэтому счетчики авторов
+        и ленты обновляются здесь. Без возврата id из bulk_create рецепты
+        сохраняются по одному, и это делает обработчик сигнала"""
+        connection = connections[Recipe.objects.db]
+        if not connection.features.can_return_rows_from_bulk_insert:
+            for recipe in recipes:
+                recipe.save(force_insert=True)
+            return recipes
+        recipes = Recipe.objects.bulk_create(recipes)
+        self.update_recipes_count(recipes)
+        TimelineEntry.objects.fan_out(recipes)
+        return recipes
+
+    @staticmethod
+    def update_recipes_count(recipes):
+        authors = defaultdict(list)
+        for author_id, count in Counter(
+            recipe.author_id for recipe in recipes if recipe.author_id
+        ).items():
+            authors[count].append(author_id)
+        for count, author_ids in authors.items():
+            User.objects.filter(pk__in=author_ids).update(
+                recipes_count=F("recipes_count") + count
+            )
+
+    def import_chunk(self, records):
+        self.resolve_authors(records)
+        self.resolve_ingredients(records)
+        with transaction.atomic():
+            recipes = self.create_recipes(
+                [
+                    Recipe(
+                        author_id=self.authors.get(record["author"]),
+                        name=record["name"],
+                        text=record["text"],
+                        cooking_time=record["cooking_time"],
+                        image=record["image"],
+                    )
+                    for record in records
+                ]
+            )
+            ingredients = []
+            tags = []
+            for recipe, record in zip(recipes, records):
+                ingredients.extend(
+                    IngredientInRecipe(
+                        recipe_id=recipe.id,
+                        ingredient_id=self.ingredients[
+                            (item["name"], item["measurement_unit"])
+                        ],
+                        amount=item["amount"],
+                    )
+                    for item in record["ingredients"]
+                )
+                for slug in record["tags"]:
+                    if slug not in self.tags:
+                        self.skipped_tags += 1
+                        continue
+                    tags.append(
+                        Recipe.tags.through(
+                            recipe_id=recipe.id, tag_id=self.tags[slug]
+                        )
+                    )
+            IngredientInRecipe.objects.bulk_create(ingredients)
+            Recipe.tags.through.objects.bulk_create(tags)
+        return len(recipes)
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from recipes.indexes import ingredient_index
+from recipes.models import Ingredient
+
+COPY_TABLE = "ingredient_load"
+NOT_BLANK = "btrim(name) <> '' AND btrim(measurement_unit) <> ''"
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает ингредиенты из CSV (название, единица измерения) или "
+        "JSON, пропуская уже существующие"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл с ингредиентами")
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json"),
+            help="Формат файла, по умолчанию определяется по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Размер пачки для bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1][1:]
+        if file_format not in ("csv", "json"):
+            raise CommandError(
+                "Не удалось определить формат файла, укажите --format"
+            )
+        connection = connections[Ingredient.objects.db]
+        with open(path, encoding="utf-8", newline="") as file:
+            if connection.vendor == "postgresql":
+                total, inserted = self.copy(connection, file, file_format)
+            else:
+                total, inserted = self.bulk_create(
+                    self.read(file, file_format), options["batch_size"]
+                )
+        if inserted:
+            ingredient_index.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Добавлено ингредиентов: {inserted}, "
+                f"пропущено: {total - inserted}"
+            )
+        )
+
+    @staticmethod
+    def read(file, file_format):
+        if file_format == "json":
+            rows = (
+                (item["name"], item["measurement_unit"])
+                for item in json.load(file)
+            )
+        else:
+            rows = csv.reader(file)
+        for number, row in enumerate(rows, start=1):
+            if len(row) != 2:
+                raise CommandError(f"Строка {number}: ожидалось два поля")
+            name, measurement_unit = (value.strip() for value in row)
+            if name and measurement_unit:
+                yield name, measurement_unit
+
+    def copy(self, connection, file, file_format):
+        if file_format == "json":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(self.read(file, file_format))
+            buffer.seek(0)
+            file = buffer
+        table = Ingredient._meta.db_table
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE {COPY_TABLE} "
+                    "(name text, measurement_unit text) ON COMMIT DROP"
+                )
+                try:
+                    cursor.copy_expert(
+                        f"COPY {COPY_TABLE} (name, measurement_unit) "
+                        "FROM STDIN WITH (FORMAT csv)",
+                        file,
+                    )
+                except connection.Database.DataError as error:
+                    raise CommandError(str(error).strip())
+                cursor.execute(
+                    f"SELECT count(*) FROM {COPY_TABLE} WHERE {NOT_BLANK}"
+                )
+                total = cursor.fetchone()[0]
+                cursor.execute(
+                    f"INSERT INTO {table} (name, measurement_unit) "
+                    "SELECT DISTINCT btrim(name), btrim(measurement_unit) "
+                    f"FROM {COPY_TABLE} "
+                    f"WHERE {NOT_BLANK} "
+                    "ON CONFLICT (name, measurement_unit) DO NOTHING"
+                )
+                inserted = cursor.rowcount
+                # ON COMMIT DROP не срабатывает, если команда вызвана
+                # внутри внешней транзакции и atomic стал точкой сохранения
+                cursor.execute(f"DROP TABLE {COPY_TABLE}")
+        return total, inserted
+
+    @staticmethod
+    def bulk_create(rows, batch_size):
+        total = 0
+        before = Ingredient.objects.count()
+        batch = []
+        for name, measurement_unit in rows:
+            batch.append(
+                Ingredient(name=name, measurement_unit=measurement_unit)
+            )
+            if len(batch) >= batch_size:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+                batch = []
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+        return total, Ingredient.objects.count() - before
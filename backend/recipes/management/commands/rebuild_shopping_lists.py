@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import IngredientInRecipe, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает агрегированные списки покупок по корзинам "
+        "пользователей и сообщает о расхождениях"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения, ничего не меняя",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Размер пачки для bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            (row["recipe__in_shopping_cart__user"], row["ingredient"]): row[
+                "total"
+            ]
+            for row in IngredientInRecipe.objects.filter(
+                recipe__in_shopping_cart__isnull=False
+            )
+            .order_by()
+            .values("recipe__in_shopping_cart__user", "ingredient")
+            .annotate(total=Sum("amount"))
+            .iterator()
+        }
+        actual = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in (
+                ShoppingListItem.objects.values_list(
+                    "user_id", "ingredient_id", "total_amount"
+                ).iterator()
+            )
+        }
+        missing = expected.keys() - actual.keys()
+        stale = actual.keys() - expected.keys()
+        wrong = [
+            key
+            for key in expected.keys() & actual.keys()
+            if expected[key] != actual[key]
+        ]
+        self.stdout.write(
+            f"Позиций: {len(expected)}, отсутствует: {len(missing)}, "
+            f"лишних: {len(stale)}, с неверным количеством: {len(wrong)}"
+        )
+        if not (missing or stale or wrong):
+            self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+            return
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Найдены расхождения"))
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=total,
+                    )
+                    for (user_id, ingredient_id), total in expected.items()
+                ),
+                batch_size=options["batch_size"],
+            )
+        self.stdout.write(self.style.SUCCESS("Списки покупок пересобраны"))
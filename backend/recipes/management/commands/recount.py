@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+def count_related(queryset, field):
+    """Количество строк queryset, ссылающихся на текущую строку через
+    field"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики избранного, корзин, рецептов и подписчиков "
+        "и сообщает о расхождениях"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        counters = (
+            (Recipe, "favorites_count", Favorite.objects, "recipe"),
+            (Recipe, "in_carts_count", ShoppingCart.objects, "recipe"),
+            (User, "recipes_count", Recipe.objects, "author"),
+            (User, "followers_count", Follow.objects, "author"),
+        )
+        with transaction.atomic():
+            for model, counter, queryset, field in counters:
+                actual = count_related(queryset, field)
+                drifted = model.objects.annotate(actual=actual).filter(
+                    ~Q(**{counter: F("actual")})
+                )
+                if options["dry_run"]:
+                    fixed = drifted.count()
+                else:
+                    fixed = drifted.update(**{counter: actual})
+                self.stdout.write(
+                    f"{model._meta.verbose_name_plural}, {counter}: "
+                    f"расхождений {fixed}"
+                )
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("Счётчики пересчитаны"))
@@ -0,0 +1,109 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone as django_timezone
+from recipes.models import (
+    Favorite,
+    PopularityWatermark,
+    RecipePopularity,
+    ShoppingCart,
+)
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+SOURCES = (
+    ("favorite", Favorite, 1.0),
+    ("shopping_cart", ShoppingCart, 2.0),
+)
+
+
+def log_add(a, b):
+    """Логарифм суммы exp(a) + exp(b) без переполнения"""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет популярность рецептов по событиям избранного и списков "
+        "покупок, появившимся после предыдущего запуска. События младше "
+        "--lag секунд откладываются до следующего запуска: строка с "
+        "меньшим id может стать видна позже из-за долгой транзакции. "
+        "События из транзакций длиннее --lag учитываются только с --full"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Пересчитать популярность по всем событиям заново",
+        )
+        parser.add_argument(
+            "--lag",
+            type=int,
+            default=10,
+            help="Сколько секунд событие ждет, прежде чем будет учтено",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Размер пачки для bulk_create и bulk_update",
+        )
+
+    def handle(self, *args, **options):
+        tau = settings.POPULARITY_HALF_LIFE_DAYS * 86400 / math.log(2)
+        cutoff = django_timezone.now() - timedelta(seconds=options["lag"])
+        with transaction.atomic():
+            if options["full"]:
+                RecipePopularity.objects.all().delete()
+                PopularityWatermark.objects.all().delete()
+            watermarks = PopularityWatermark.objects.select_for_update()
+            scores = {}
+            events = 0
+            for source, model, weight in SOURCES:
+                watermark, _ = watermarks.get_or_create(source=source)
+                rows = (
+                    model.objects.filter(id__gt=watermark.last_id)
+                    .order_by("id")
+                    .values_list("id", "recipe_id", "created")
+                )
+                for pk, recipe_id, created in rows.iterator():
+                    if created > cutoff:
+                        break
+                    weight_log = (created - EPOCH).total_seconds() / tau
+                    scores[recipe_id] = log_add(
+                        scores.get(recipe_id), weight_log + math.log(weight)
+                    )
+                    watermark.last_id = pk
+                    events += 1
+                watermark.save()
+            self.save_scores(scores, options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Учтено событий: {events}, обновлено рецептов: {len(scores)}"
+            )
+        )
+
+    @staticmethod
+    def save_scores(scores, batch_size):
+        existing = RecipePopularity.objects.in_bulk(list(scores))
+        now = django_timezone.now()
+        for recipe_id, popularity in existing.items():
+            popularity.score = log_add(popularity.score, scores[recipe_id])
+            popularity.updated = now
+        RecipePopularity.objects.bulk_update(
+            existing.values(), ["score", "updated"], batch_size=batch_size
+        )
+        RecipePopularity.objects.bulk_create(
+            [
+                RecipePopularity(recipe_id=recipe_id, score=score)
+                for recipe_id, score in scores.items()
+                if recipe_id not in existing
+            ],
+            batch_size=batch_size,
+        )
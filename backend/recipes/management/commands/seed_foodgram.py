@@ -0,0 +1,214 @@
+import csv
+import os
+import time
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connections
+from django.db.models import Max
+from recipes.indexes import ingredient_index, pantry_index
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.seeding import init_worker, recipe_count, run_task
+from users.models import User
+
+TAGS = (
+    ("Завтрак", "#E26C2D", "breakfast"),
+    ("Обед", "#49B64E", "lunch"),
+    ("Ужин", "#8775D2", "dinner"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими пользователями, рецептами, "
+        "подписками, избранным и корзинами для нагрузочного тестирования. "
+        "При одинаковом зерне данные совпадают при любом числе процессов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Количество пользователей"
+        )
+        parser.add_argument(
+            "--alpha",
+            type=float,
+            default=1.2,
+            help=(
+                "Показатель распределения Парето для числа рецептов автора, "
+                "чем меньше, тем больше плодовитых авторов"
+            ),
+        )
+        parser.add_argument(
+            "--max-recipes",
+            type=int,
+            default=1000,
+            help="Максимальное число рецептов одного автора",
+        )
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=10,
+            help="Среднее число подписок пользователя",
+        )
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=20,
+            help="Среднее число рецептов в избранном",
+        )
+        parser.add_argument(
+            "--cart",
+            type=int,
+            default=3,
+            help="Среднее число рецептов в корзине",
+        )
+        parser.add_argument(
+            "--ingredients",
+            default=os.path.join(
+                settings.BASE_DIR.parent, "data", "ingredients.csv"
+            ),
+            help="CSV с ингредиентами (название, единица измерения)",
+        )
+        parser.add_argument(
+            "--password",
+            default="foodgram",
+            help="Пароль всех созданных пользователей",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Зерно")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Количество процессов, вне PostgreSQL всегда один",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Количество пользователей в одной задаче",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Размер пачки для bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        config = {
+            key: options[key]
+            for key in (
+                "seed",
+                "users",
+                "alpha",
+                "max_recipes",
+                "follows",
+                "favorites",
+                "cart",
+                "batch_size",
+            )
+        }
+        config.update(
+            password=make_password(options["password"]),
+            tags=self.get_tags(),
+            ingredients=self.get_ingredients(options["ingredients"]),
+            user_base=self.next_id(User),
+            recipe_base=self.next_id(Recipe),
+        )
+        init_worker(config)
+        chunks = []
+        config["recipes"] = 0
+        for start in range(0, options["users"], options["chunk_size"]):
+            stop = min(start + options["chunk_size"], options["users"])
+            chunks.append((start, stop, config["recipes"]))
+            config["recipes"] += sum(map(recipe_count, range(start, stop)))
+        workers = options["workers"]
+        if connections[Recipe.objects.db].vendor != "postgresql":
+            workers = 1
+        self.run("users", chunks, config, workers)
+        self.reset_sequences(User)
+        self.run("follows", chunks, config, workers)
+        call_command("recount", stdout=self.stdout)
+        self.run("recipes", chunks, config, workers)
+        self.reset_sequences(Recipe)
+        if config["recipes"]:
+            self.run("lists", chunks, config, workers)
+        call_command("recount", stdout=self.stdout)
+        call_command("rebuild_shopping_lists", stdout=self.stdout)
+        ingredient_index.invalidate()
+        pantry_index.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пользователей: {options['users']}, рецептов: "
+                f"{config['recipes']} за "
+                f"{time.monotonic() - started:.1f} с"
+            )
+        )
+
+    def run(self, phase, chunks, config, workers):
+        started = time.monotonic()
+        tasks = [(phase, *chunk) for chunk in chunks]
+        if workers > 1:
+            connections.close_all()
+            with Pool(
+                workers, initializer=init_worker, initargs=(config,)
+            ) as pool:
+                rows = sum(pool.imap_unordered(run_task, tasks))
+        else:
+            rows = sum(map(run_task, tasks))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{phase}: {rows} строк за {elapsed:.1f} с "
+            f"({rows / max(elapsed, 1e-6):.0f} в секунду)"
+        )
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+    @staticmethod
+    def reset_sequences(model):
+        """Строки создаются с явными id, счетчик последовательности
+        нужно сдвинуть за них"""
+        connection = connections[model.objects.db]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
+
+    @staticmethod
+    def get_tags():
+        Tag.objects.bulk_create(
+            [
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            ],
+            ignore_conflicts=True,
+        )
+        return list(Tag.objects.order_by("id").values_list("id", flat=True))
+
+    @staticmethod
+    def get_ingredients(path):
+        with open(path, encoding="utf-8", newline="") as file:
+            names = {
+                (name.strip(), measurement_unit.strip())
+                for name, measurement_unit in csv.reader(file)
+            }
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in sorted(names)
+            ],
+            ignore_conflicts=True,
+        )
+        return [
+            pk
+            for pk, name, measurement_unit in Ingredient.objects.order_by(
+                "id"
+            ).values_list("id", "name", "measurement_unit")
+            if (name, measurement_unit) in names
+        ]
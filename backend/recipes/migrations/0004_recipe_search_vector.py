@@ -0,0 +1,42 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+CREATE_SEARCH_VECTOR = """
+ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+    ) STORED;
+CREATE INDEX recipes_recipe_search_vector_idx
+    ON recipes_recipe USING gin (search_vector);
+CREATE INDEX recipes_recipe_name_trgm_idx
+    ON recipes_recipe USING gin (name gin_trgm_ops);
+"""
+
+DROP_SEARCH_VECTOR = """
+DROP INDEX IF EXISTS recipes_recipe_name_trgm_idx;
+DROP INDEX IF EXISTS recipes_recipe_search_vector_idx;
+ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def create_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_VECTOR)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
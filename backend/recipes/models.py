@@ -1,10 +1,27 @@
+from collections import defaultdict
+
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from users.models import User
+from django.db import connections, models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    Window,
+)
+from django.db.models.functions import Greatest, RowNumber
+from users.models import Follow, User
 from foodgram.settings import (
     MAX_COOKING_TIME,
     MIN_COOKING_TIME,
     DEFAULT_COOKING_TIME,
+    FEED_BACKFILL_SIZE,
+    FEED_FANOUT_MAX_FOLLOWERS,
     MAX_AMOUNT_WEIGHT_PRODUCT,
     MIN_AMOUNT_WEIGHT_PRODUCT,
 )
@@ -65,6 +82,94 @@ class Ingredient(models.Model):
         return f"{self.name}, {self.measurement_unit}"
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для сериализатора RecipeReadSerializer"""
+
+    @staticmethod
+    def related_lookups():
+        return (
+            Prefetch("tags"),
+            Prefetch(
+                "recipe_ingredients",
+                queryset=IngredientInRecipe.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+
+    def with_related(self):
+        return self.select_related("author").prefetch_related(
+            *self.related_lookups()
+        )
+
+    def annotate_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+                author_is_subscribed=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            author_is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author"))
+            ),
+        )
+
+    def by_pantry(self, ingredient_ids, max_missing=0):
+        """То же, что PantryIndex.search, средствами SQL"""
+        return (
+            self.annotate(
+                available=Count(
+                    "recipe_ingredients",
+                    filter=Q(
+                        recipe_ingredients__ingredient__in=ingredient_ids
+                    ),
+                ),
+                missing=Count("recipe_ingredients") - F("available"),
+            )
+            .filter(available__gt=0, missing__lte=max_missing)
+            .order_by("missing", "-id")
+        )
+
+    def group_by_author(self, author_ids, limit=None):
+        """Последние рецепты авторов одним запросом, не более limit
+        на автора. Без поддержки оконных функций лишнее отсекается
+        на стороне Python"""
+        recipes = self.filter(author_id__in=author_ids)
+        if limit is not None and connections[
+            self.db
+        ].features.supports_over_clause:
+            ranked = recipes.annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F("author_id"),
+                    order_by=F("id").desc(),
+                )
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = self.raw(
+                f"SELECT * FROM ({sql}) AS ranked "
+                "WHERE ranked.position <= %s "
+                "ORDER BY ranked.author_id, ranked.position",
+                (*params, limit),
+            )
+        grouped = defaultdict(list)
+        for recipe in recipes:
+            if limit is None or len(grouped[recipe.author_id]) < limit:
+                grouped[recipe.author_id].append(recipe)
+        return grouped
+
+
 class Recipe(models.Model):
     """Модель рецептов"""
 
@@ -110,6 +215,18 @@ class Recipe(models.Model):
         upload_to="recipes/",
         blank=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок",
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ["-id"]
@@ -182,6 +299,10 @@ class Favorite(models.Model):
         verbose_name="Рецепт",
         related_name="in_favorite",
     )
+    created = models.DateTimeField(
+        verbose_name="Добавлено",
+        auto_now_add=True,
+    )
 
     class Meta:
         ordering = ["recipe__name"]
@@ -193,6 +314,12 @@ class Favorite(models.Model):
                 fields=["recipe", "user"],
             ),
         ]
+        indexes = [
+            models.Index(
+                name="favorite_user_recipe_idx",
+                fields=["user", "recipe"],
+            ),
+        ]
 
     def __str__(self):
         return f"{self.recipe} добавлен в избранное пользователем {self.user}"
@@ -213,6 +340,10 @@ class ShoppingCart(models.Model):
         verbose_name="Рецепт",
         related_name="in_shopping_cart",
     )
+    created = models.DateTimeField(
+        verbose_name="Добавлено",
+        auto_now_add=True,
+    )
 
     class Meta:
         ordering = ["recipe__name"]
@@ -227,3 +358,316 @@ class ShoppingCart(models.Model):
 
     def __str__(self) -> str:
         return f"{self.user} добавил в список {self.recipe}"
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """Инкрементальное обновление агрегированных списков покупок"""
+
+    def add_recipes(self, user_ids, recipe_ids):
+        ingredient_ids = set(
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list("ingredient_id", flat=True)
+        )
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    ShoppingListItem(user_id=user_id, ingredient_id=ingredient)
+                    for user_id in user_ids
+                    for ingredient in ingredient_ids
+                ],
+                ignore_conflicts=True,
+            )
+            self._get_items(user_ids, recipe_ids).update(
+                total_amount=F("total_amount")
+                + self._get_amounts(recipe_ids)
+            )
+
+    def remove_recipes(self, user_ids, recipe_ids):
+        with transaction.atomic():
+            self._get_items(user_ids, recipe_ids).update(
+                total_amount=Greatest(
+                    F("total_amount") - self._get_amounts(recipe_ids),
+                    Value(0),
+                )
+            )
+            self.filter(user_id__in=user_ids, total_amount=0).delete()
+
+    def _get_items(self, user_ids, recipe_ids):
+        return self.filter(
+            user_id__in=user_ids,
+            ingredient_id__in=IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values("ingredient_id"),
+        )
+
+    @staticmethod
+    def _get_amounts(recipe_ids):
+        return Subquery(
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids, ingredient=OuterRef("ingredient")
+            )
+            .order_by()
+            .values("ingredient")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Модель агрегированного списка покупок пользователя"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Ингредиент",
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name="Общее количество",
+        default=0,
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Позиции списков покупок"
+        constraints = [
+            models.UniqueConstraint(
+                name="Ингредиент в списке покупок должен быть уникальным",
+                fields=["user", "ingredient"],
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ingredient}: {self.total_amount}"
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    """
+    Лента подписок заполняется при публикации рецепта. Рецепты авторов,
+    у которых подписчиков больше FEED_FANOUT_MAX_FOLLOWERS, в ленту
+    не раскладываются и читаются напрямую при запросе ленты
+    """
+
+    def fan_out(self, recipes, batch_size=1000):
+        """Возвращает количество записанных в ленты строк, включая
+        уже существовавшие"""
+        recipe_ids = defaultdict(list)
+        for recipe in recipes:
+            if recipe.author_id is not None:
+                recipe_ids[recipe.author_id].append(recipe.id)
+        followers = Follow.objects.filter(
+            author__in=recipe_ids,
+            author__followers_count__lte=FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("author_id", "user_id")
+        batch = []
+        count = 0
+        for author_id, user_id in followers.iterator():
+            batch.extend(
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in recipe_ids[author_id]
+            )
+            if len(batch) >= batch_size:
+                self.bulk_create(batch, ignore_conflicts=True)
+                count += len(batch)
+                batch = []
+        self.bulk_create(batch, ignore_conflicts=True)
+        return count + len(batch)
+
+    def backfill(self, user, authors):
+        author_ids = [
+            author.id
+            for author in authors
+            if author.followers_count <= FEED_FANOUT_MAX_FOLLOWERS
+        ]
+        if not author_ids:
+            return
+        recipes = Recipe.objects.group_by_author(
+            author_ids, limit=FEED_BACKFILL_SIZE
+        )
+        self.bulk_create(
+            [
+                TimelineEntry(user=user, recipe=recipe)
+                for author_recipes in recipes.values()
+                for recipe in author_recipes
+            ],
+            ignore_conflicts=True,
+        )
+
+    def prune(self, user, authors):
+        self.filter(user=user, recipe__author__in=authors).delete()
+
+    def recipe_ids(self, user, before=None, after=None, limit=None):
+        """Id рецептов ленты по убыванию, с учетом авторов, рецепты
+        которых не раскладываются по лентам. С after берутся limit
+        ближайших к нему более новых рецептов"""
+        timeline = self.filter(user=user)
+        pulled = Recipe.objects.filter(
+            author__in=Follow.objects.filter(
+                user=user,
+                author__followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS,
+            ).values("author")
+        )
+        if before is not None:
+            timeline = timeline.filter(recipe_id__lt=before)
+            pulled = pulled.filter(id__lt=before)
+        if after is not None:
+            timeline = timeline.filter(recipe_id__gt=after)
+            pulled = pulled.filter(id__gt=after)
+        descending = after is None
+        ids = set(
+            timeline.order_by(
+                "-recipe_id" if descending else "recipe_id"
+            ).values_list("recipe_id", flat=True)[:limit]
+        )
+        ids.update(
+            pulled.order_by("-id" if descending else "id").values_list(
+                "id", flat=True
+            )[:limit]
+        )
+        ids = sorted(ids, reverse=descending)[:limit]
+        return sorted(ids, reverse=True)
+
+
+class TimelineEntry(models.Model):
+    """Запись в ленте подписок пользователя"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Рецепт",
+    )
+    created = models.DateTimeField(
+        verbose_name="Добавлено",
+        auto_now_add=True,
+    )
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи лент"
+        constraints = [
+            models.UniqueConstraint(
+                name="Рецепт уже есть в ленте",
+                fields=["user", "recipe"],
+            )
+        ]
+        indexes = [
+            models.Index(
+                name="timeline_user_recipe_idx",
+                fields=["user", "-recipe"],
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user}: {self.recipe}"
+
+
+class RecipePopularity(models.Model):
+    """
+    Популярность рецепта по добавлениям в избранное и в списки покупок.
+    Хранится логарифм суммы весов событий, вес растет экспоненциально
+    со временем события, поэтому старые события теряют значение
+    без пересчета уже накопленных оценок
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity",
+        verbose_name="Рецепт",
+    )
+    score = models.FloatField(
+        verbose_name="Оценка",
+    )
+    updated = models.DateTimeField(
+        verbose_name="Обновлено",
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = "Популярность рецепта"
+        verbose_name_plural = "Популярность рецептов"
+        indexes = [
+            models.Index(name="popularity_score_idx", fields=["-score"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.recipe_id}: {self.score:.2f}"
+
+
+class PopularityWatermark(models.Model):
+    """Последнее учтенное в популярности событие каждого источника"""
+
+    source = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name="Источник",
+    )
+    last_id = models.BigIntegerField(
+        verbose_name="Последний id",
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = "Отметка пересчета популярности"
+        verbose_name_plural = "Отметки пересчета популярности"
+
+    def __str__(self) -> str:
+        return f"{self.source}: {self.last_id}"
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт по общим ингредиентам и тегам"""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Рецепт",
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField(
+        verbose_name="Коэффициент Жаккара",
+    )
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        constraints = [
+            models.UniqueConstraint(
+                name="Похожий рецепт уже сохранен",
+                fields=["recipe", "similar"],
+            )
+        ]
+        indexes = [
+            models.Index(
+                name="similarity_recipe_score_idx",
+                fields=["recipe", "-score"],
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.recipe_id} ~ {self.similar_id}: {self.score:.2f}"
@@ -0,0 +1,205 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from users.models import Follow, User
+
+from .models import (
+    Favorite,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    TimelineEntry,
+)
+
+FIRST_NAMES = (
+    "Анна",
+    "Иван",
+    "Мария",
+    "Петр",
+    "Ольга",
+    "Сергей",
+    "Елена",
+    "Дмитрий",
+)
+LAST_NAMES = (
+    "Иванов",
+    "Смирнов",
+    "Кузнецов",
+    "Попов",
+    "Соколов",
+    "Лебедев",
+    "Козлов",
+    "Новиков",
+)
+WORDS = (
+    "нарезать",
+    "смешать",
+    "обжарить",
+    "запечь",
+    "посолить",
+    "добавить",
+    "варить",
+    "остудить",
+    "подавать",
+    "с зеленью",
+    "на медленном огне",
+    "до готовности",
+)
+DISHES = ("Салат", "Суп", "Пирог", "Рагу", "Каша", "Запеканка", "Омлет")
+
+_config = None
+
+
+def init_worker(config):
+    global _config
+    _config = config
+
+
+def get_random(phase, index):
+    """Генератор, зависящий только от зерна, этапа и номера
+    пользователя, поэтому результат не зависит от числа процессов"""
+    return random.Random(f"{_config['seed']}:{phase}:{index}")
+
+
+def recipe_count(index):
+    """Количество рецептов автора, распределение Парето"""
+    generator = get_random("recipes", index)
+    return min(
+        int(generator.paretovariate(_config["alpha"])) - 1,
+        _config["max_recipes"],
+    )
+
+
+def skewed(generator, size, skew=3):
+    """Номер от 0 до size - 1, малые номера выпадают чаще"""
+    return int(size * generator.random() ** skew)
+
+
+def seed_users(start, stop, recipe_start):
+    users = []
+    for index in range(start, stop):
+        generator = get_random("users", index)
+        pk = _config["user_base"] + index
+        users.append(
+            User(
+                id=pk,
+                email=f"user{pk}@seed.foodgram",
+                username=f"user{pk}",
+                first_name=generator.choice(FIRST_NAMES),
+                last_name=generator.choice(LAST_NAMES),
+                password=_config["password"],
+            )
+        )
+    User.objects.bulk_create(users, batch_size=_config["batch_size"])
+    return len(users)
+
+
+def seed_follows(start, stop, recipe_start):
+    follows = []
+    for index in range(start, stop):
+        generator = get_random("follows", index)
+        authors = {
+            skewed(generator, _config["users"])
+            for _ in range(generator.randint(0, 2 * _config["follows"]))
+        }
+        authors.discard(index)
+        follows.extend(
+            Follow(
+                user_id=_config["user_base"] + index,
+                author_id=_config["user_base"] + author,
+            )
+            for author in sorted(authors)
+        )
+    Follow.objects.bulk_create(
+        follows, batch_size=_config["batch_size"], ignore_conflicts=True
+    )
+    return len(follows)
+
+
+def seed_recipes(start, stop, recipe_start):
+    recipes = []
+    ingredients = []
+    tags = []
+    pk = _config["recipe_base"] + recipe_start
+    for index in range(start, stop):
+        for _ in range(recipe_count(index)):
+            generator = get_random("recipe", pk)
+            recipes.append(
+                Recipe(
+                    id=pk,
+                    author_id=_config["user_base"] + index,
+                    name=f"{generator.choice(DISHES)} №{pk}",
+                    text=" ".join(generator.choices(WORDS, k=20)),
+                    cooking_time=generator.randint(
+                        settings.MIN_COOKING_TIME, 180
+                    ),
+                )
+            )
+            ingredients.extend(
+                IngredientInRecipe(
+                    recipe_id=pk,
+                    ingredient_id=ingredient_id,
+                    amount=generator.randint(1, 500),
+                )
+                for ingredient_id in generator.sample(
+                    _config["ingredients"],
+                    min(generator.randint(3, 12), len(_config["ingredients"])),
+                )
+            )
+            tags.extend(
+                Recipe.tags.through(recipe_id=pk, tag_id=tag_id)
+                for tag_id in generator.sample(
+                    _config["tags"],
+                    generator.randint(1, min(3, len(_config["tags"]))),
+                )
+            )
+            pk += 1
+    batch_size = _config["batch_size"]
+    Recipe.objects.bulk_create(recipes, batch_size=batch_size)
+    IngredientInRecipe.objects.bulk_create(ingredients, batch_size=batch_size)
+    Recipe.tags.through.objects.bulk_create(tags, batch_size=batch_size)
+    timeline = TimelineEntry.objects.fan_out(recipes, batch_size=batch_size)
+    return len(recipes) + len(ingredients) + len(tags) + timeline
+
+
+def seed_lists(start, stop, recipe_start):
+    rows = {Favorite: [], ShoppingCart: []}
+    for index in range(start, stop):
+        generator = get_random("lists", index)
+        for model, average in (
+            (Favorite, _config["favorites"]),
+            (ShoppingCart, _config["cart"]),
+        ):
+            recipes = {
+                skewed(generator, _config["recipes"])
+                for _ in range(generator.randint(0, 2 * average))
+            }
+            rows[model].extend(
+                model(
+                    user_id=_config["user_base"] + index,
+                    recipe_id=_config["recipe_base"] + recipe,
+                )
+                for recipe in sorted(recipes)
+            )
+    for model, objects in rows.items():
+        model.objects.bulk_create(
+            objects, batch_size=_config["batch_size"], ignore_conflicts=True
+        )
+    return sum(len(objects) for objects in rows.values())
+
+
+PHASES = {
+    "users": seed_users,
+    "follows": seed_follows,
+    "recipes": seed_recipes,
+    "lists": seed_lists,
+}
+
+
+def run_task(task):
+    """Задача - этап и диапазон номеров пользователей, каждая
+    выполняется в своей транзакции, возвращает число строк"""
+    phase, start, stop, recipe_start = task
+    with transaction.atomic():
+        return PHASES[phase](start, stop, recipe_start)
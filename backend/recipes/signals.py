@@ -0,0 +1,63 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import User
+
+from .indexes import ingredient_index, pantry_index, tag_index
+from .models import (
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+    TimelineEntry,
+)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_index(**kwargs):
+    tag_index.invalidate()
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def update_pantry_index(instance, **kwargs):
+    pantry_index.recipe_changed(instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(instance, **kwargs):
+    """Вызывается до каскадного удаления корзин и ингредиентов рецепта,
+    поэтому работает при удалении из API, админки и через ORM"""
+    user_ids = list(
+        instance.in_shopping_cart.order_by().values_list("user", flat=True)
+    )
+    if user_ids:
+        ShoppingListItem.objects.remove_recipes(user_ids, [instance.id])
+
+
+@receiver(post_save, sender=Recipe)
+def publish_recipe(instance, created, raw, **kwargs):
+    """Счетчик рецептов автора и ленты подписчиков обновляются при любом
+    способе создания рецепта, кроме bulk_create и загрузки фикстур"""
+    if not created or raw:
+        return
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=F("recipes_count") + 1
+    )
+    TimelineEntry.objects.fan_out([instance])
+
+
+@receiver(post_delete, sender=Recipe)
+def unpublish_recipe(instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=Greatest(F("recipes_count") - 1, 0)
+    )
@@ -0,0 +1,120 @@
+from itertools import chain
+
+import numpy as np
+
+from .models import IngredientInRecipe, Recipe
+
+_matrix = None
+
+
+class IncidenceMatrix:
+    """
+    Разреженная матрица рецепт x признак (ингредиенты и теги). Редкие
+    признаки хранятся в формате CSR вместе с транспонированной матрицей
+    для поиска рецептов по признаку, частые (теги, соль, сахар) плотной
+    матрицей, пересечения по ним считаются умножением матриц
+    """
+
+    def __init__(
+        self, recipe_ids, rows, features, feature_count, dense_share=0.01
+    ):
+        count = len(recipe_ids)
+        self.recipe_ids = recipe_ids
+        self.sizes = np.bincount(rows, minlength=count).astype(np.float32)
+        frequency = np.bincount(features, minlength=feature_count)
+        is_dense = frequency > max(dense_share * count, 1)
+        dense_columns = np.cumsum(is_dense) - 1
+        in_dense = is_dense[features]
+        self.dense = np.zeros((count, is_dense.sum()), dtype=np.float32)
+        self.dense[rows[in_dense], dense_columns[features[in_dense]]] = 1
+        rows, features = rows[~in_dense], features[~in_dense]
+        self.indptr, self.indices = self.compress(rows, features, count)
+        self.column_ptr, self.column_indices = self.compress(
+            features, rows, feature_count
+        )
+
+    @staticmethod
+    def compress(rows, values, size):
+        order = np.lexsort((values, rows))
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+        return indptr, values[order].astype(np.int32)
+
+    @classmethod
+    def load(cls):
+        recipe_ids = np.fromiter(
+            Recipe.objects.order_by("id").values_list("id", flat=True),
+            dtype=np.int64,
+        )
+        ingredients = IngredientInRecipe.objects.order_by().values_list(
+            "recipe_id", "ingredient_id"
+        )
+        tags = Recipe.tags.through.objects.order_by().values_list(
+            "recipe_id", "tag_id"
+        )
+        pairs = [
+            np.fromiter(
+                chain.from_iterable(queryset.iterator()), dtype=np.int64
+            ).reshape(-1, 2)
+            for queryset in (ingredients, tags)
+        ]
+        offset = pairs[0][:, 1].max() + 1 if len(pairs[0]) else 0
+        pairs[1][:, 1] += offset
+        pairs = np.concatenate(pairs)
+        rows = np.searchsorted(recipe_ids, pairs[:, 0])
+        feature_ids, features = np.unique(pairs[:, 1], return_inverse=True)
+        return cls(recipe_ids, rows, features, len(feature_ids))
+
+    def jaccard(self, start, stop):
+        """Коэффициенты Жаккара строк start:stop со всеми рецептами,
+        массив размера (stop - start) x число рецептов"""
+        count = len(self.recipe_ids)
+        intersection = self.dense[start:stop] @ self.dense.T
+        features = self.indices[self.indptr[start]:self.indptr[stop]]
+        lengths = self.column_ptr[features + 1] - self.column_ptr[features]
+        offsets = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        neighbours = self.column_indices[
+            np.repeat(self.column_ptr[features], lengths) + offsets
+        ]
+        owners = np.repeat(
+            np.repeat(
+                np.arange(stop - start), np.diff(self.indptr[start:stop + 1])
+            ),
+            lengths,
+        )
+        intersection += np.bincount(
+            owners * count + neighbours, minlength=(stop - start) * count
+        ).reshape(stop - start, count)
+        union = self.sizes[start:stop, None] + self.sizes[None, :]
+        union -= intersection
+        intersection /= np.maximum(union, 1)
+        intersection[np.arange(stop - start), np.arange(start, stop)] = 0
+        return intersection
+
+
+def init_worker(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def top_similar(block):
+    """Не более top_k похожих рецептов для каждой строки блока в виде
+    списка (id рецепта, id похожего, коэффициент)"""
+    start, stop, top_k = block
+    scores = _matrix.jaccard(start, stop)
+    top_k = min(top_k, scores.shape[1] - 1)
+    if top_k <= 0:
+        return []
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    result = []
+    for row, columns in enumerate(top):
+        recipe_id = int(_matrix.recipe_ids[start + row])
+        for column in columns[np.argsort(-scores[row, columns])]:
+            score = float(scores[row, column])
+            if score > 0:
+                result.append(
+                    (recipe_id, int(_matrix.recipe_ids[column]), score)
+                )
+    return result
@@ -1,3 +1,4 @@
+from api.authentication import token_cache
 from django.contrib import admin
 
 from .models import User
@@ -11,8 +12,19 @@ class UserAdmin(admin.ModelAdmin):
         "email",
         "last_name",
         "first_name",
+        "recipes_count",
+        "followers_count",
     )
     list_filter = (
         "email",
         "username",
     )
+    actions = ("deactivate",)
+
+    @admin.action(description="Заблокировать выбранных пользователей")
+    def deactivate(self, request, queryset):
+        """update() не отправляет post_save, поэтому кэш токенов
+        сбрасывается здесь, иначе токены действуют до TOKEN_CACHE TIMEOUT"""
+        user_ids = list(queryset.values_list("id", flat=True))
+        queryset.update(is_active=False)
+        token_cache.invalidate_users(user_ids)